@@ -1,18 +1,438 @@
 import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+import math
+import time
+from collections import OrderedDict, deque
+from functools import cached_property, lru_cache
+from itertools import islice
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Any, Optional, Tuple
 import re
+import string
 
 from services.rag_service import RAGService
-from services.web_service import WebService
+from services.web_service import WebService, NullWebService
 from services.stt_service import STTService
 from core.config import settings
+import ahocorasick
+import httpx
 import openai
+import orjson
+import redis.asyncio as aioredis
+from py3langid.langid import LanguageIdentifier, MODEL_FILE
 
 logger = logging.getLogger(__name__)
 
 
+# EU Green Deal keywords for query classification
+EU_GREEN_KEYWORDS = (
+    'green deal', 'eu green', 'european green', 'climate law', 'biodiversity',
+    'cbam', 'carbon border', 'farm to fork', 'circular economy', 'taxonomy',
+    'emissions trading', 'renewable energy', 'energy efficiency', 'fit for 55',
+    'climate neutral', 'net zero', 'paris agreement', 'climate change',
+    'sustainability', 'environmental policy', 'carbon footprint', 'emission',
+    'directive', 'regulation', 'compliance', 'environment', 'climate',
+    'sustainable', 'carbon', 'greenhouse gas', 'pollution',
+    'ecosystem', 'deforestation', 'reforestation', 'organic farming',
+    'pesticide', 'fertilizer', 'soil health', 'water quality', 'air quality',
+    'waste management', 'recycling', 'plastic', 'packaging', 'transport',
+    'aviation', 'maritime', 'shipping', 'electric vehicle', 'hydrogen',
+    'solar', 'wind', 'battery', 'energy storage', 'grid', 'smart city',
+    'building renovation', 'insulation', 'heat pump', 'district heating',
+    'industrial strategy', 'steel', 'cement', 'chemical', 'textile',
+    'construction', 'digital', 'artificial intelligence', 'blockchain',
+    'monitoring', 'reporting', 'verification', 'audit', 'certification',
+    'label', 'standard', 'criteria', 'threshold', 'target', 'goal',
+    'objective', 'milestone', 'timeline', 'deadline', 'implementation',
+    'transition', 'transformation', 'innovation', 'investment', 'funding',
+    'finance', 'bank', 'loan', 'subsidy', 'incentive', 'tax', 'levy',
+    'penalty', 'fine', 'enforcement', 'litigation', 'court', 'justice'
+)
+
+IDENTITY_KEYWORDS = (
+    "who are you", "what are you", "tell me about yourself",
+    "your identity", "your name", "who created you",
+    "who made you", "who built you", "who engineered you",
+    "your creator", "your developer", "about verdana"
+)
+
+POLICY_KEYWORDS = ('policy', 'regulation', 'directive', 'law', 'compliance', 'requirement')
+
+# Greetings and small talk, matched from the start of short normalized queries; the
+# first group must be the whole query, the rest may be followed by more words
+_CASUAL_RE = re.compile(
+    r"(?:hi|hello|hey|good (?:morning|afternoon|evening)|thanks?|thx|thank you"
+    r"|ok|okay|yes|no|bye|goodbye)$"
+    r"|how are you|what's up|see you|nice to meet you|pleased to meet you"
+)
+
+
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'ro': 'Romanian',
+    'fr': 'French', 
+    'de': 'German',
+    'es': 'Spanish',
+    'it': 'Italian',
+    'pl': 'Polish',
+    'pt': 'Portuguese',
+    'nl': 'Dutch',
+    'da': 'Danish',
+    'sv': 'Swedish',
+    'fi': 'Finnish',
+    'el': 'Greek',
+    'hu': 'Hungarian',
+    'cs': 'Czech',
+    'sk': 'Slovak',
+    'sl': 'Slovenian',
+    'bg': 'Bulgarian',
+    'hr': 'Croatian',
+    'et': 'Estonian',
+    'lv': 'Latvian',
+    'lt': 'Lithuanian',
+    'mt': 'Maltese'
+}
+
+# ISO 639 code as returned by the language detection model
+_LANG_RE = re.compile(r'[a-z]{2,3}')
+
+
+# Exact (normalized) casual messages answered without calling the LLM
+CANNED_INTENTS = {
+    **dict.fromkeys(
+        ("hi", "hello", "hey", "good morning", "good afternoon", "good evening"), "greeting"
+    ),
+    **dict.fromkeys(("thanks", "thank you", "thx"), "thanks"),
+    **dict.fromkeys(("bye", "goodbye"), "goodbye"),
+}
+
+# Replies per (session language, intent), rendered once at import; other languages
+# fall through to the LLM
+CANNED_RESPONSES = {
+    ("en", "greeting"): f"Hello! I'm {settings.AGENT_NAME}, your EU Green Deal Compliance Assistant. Ask me anything about EU climate and environmental policy, from CBAM to the EU Taxonomy - how can I help you today?",
+    ("en", "thanks"): "You're very welcome! If you have more questions about the EU Green Deal or compliance requirements, just ask.",
+    ("en", "goodbye"): "Goodbye! Come back anytime you need help with EU Green Deal policies.",
+    ("ro", "greeting"): f"Bună! Sunt {settings.AGENT_NAME}, asistentul tău pentru conformitatea cu Pactul Verde European. Întreabă-mă orice despre politicile climatice și de mediu ale UE - cu ce te pot ajuta astăzi?",
+    ("ro", "thanks"): "Cu plăcere! Dacă mai ai întrebări despre Pactul Verde European sau cerințele de conformitate, sunt aici.",
+    ("ro", "goodbye"): "La revedere! Revino oricând ai nevoie de ajutor cu politicile Pactului Verde European.",
+    ("fr", "greeting"): f"Bonjour ! Je suis {settings.AGENT_NAME}, votre assistante de conformité au Pacte vert pour l'Europe. Posez-moi vos questions sur les politiques climatiques et environnementales de l'UE - comment puis-je vous aider aujourd'hui ?",
+    ("fr", "thanks"): "Avec plaisir ! Si vous avez d'autres questions sur le Pacte vert ou les exigences de conformité, n'hésitez pas.",
+    ("fr", "goodbye"): "Au revoir ! Revenez quand vous voulez pour toute question sur le Pacte vert pour l'Europe.",
+    ("de", "greeting"): f"Hallo! Ich bin {settings.AGENT_NAME}, Ihre Assistentin für die Einhaltung des europäischen Grünen Deals. Fragen Sie mich alles zur Klima- und Umweltpolitik der EU - wie kann ich Ihnen heute helfen?",
+    ("de", "thanks"): "Gern geschehen! Wenn Sie weitere Fragen zum Grünen Deal oder zu Compliance-Anforderungen haben, fragen Sie einfach.",
+    ("de", "goodbye"): "Auf Wiedersehen! Kommen Sie jederzeit wieder, wenn Sie Hilfe zum europäischen Grünen Deal brauchen.",
+    ("es", "greeting"): f"¡Hola! Soy {settings.AGENT_NAME}, tu asistente de cumplimiento del Pacto Verde Europeo. Pregúntame lo que quieras sobre la política climática y medioambiental de la UE: ¿en qué puedo ayudarte hoy?",
+    ("es", "thanks"): "¡De nada! Si tienes más preguntas sobre el Pacto Verde Europeo o los requisitos de cumplimiento, aquí estoy.",
+    ("es", "goodbye"): "¡Hasta luego! Vuelve cuando necesites ayuda con las políticas del Pacto Verde Europeo.",
+    ("it", "greeting"): f"Ciao! Sono {settings.AGENT_NAME}, la tua assistente per la conformità al Green Deal europeo. Chiedimi qualsiasi cosa sulle politiche climatiche e ambientali dell'UE: come posso aiutarti oggi?",
+    ("it", "thanks"): "Prego! Se hai altre domande sul Green Deal europeo o sui requisiti di conformità, chiedi pure.",
+    ("it", "goodbye"): "Arrivederci! Torna quando vuoi per un aiuto sulle politiche del Green Deal europeo.",
+}
+
+# Redis key prefix for shared session state ("session:<id>:messages" / ":language")
+SESSION_KEY_PREFIX = "session:"
+
+# Redis key prefix for EU Green Deal answers shared between workers
+RESPONSE_CACHE_KEY_PREFIX = "chat:"
+
+# Fixed answer for questions about the assistant itself, rendered once at import
+IDENTITY_RESPONSE = f"""
+I am **{settings.AGENT_NAME}**, your EU Green Deal Compliance Assistant. My name reflects my expertise in green ("verde") policy analysis ("ana").
+
+## My Capabilities:
+- **EU Green Deal Expertise**: Deep knowledge of EU environmental policies and regulations
+- **Document Analysis**: Access to comprehensive EU Green Deal documentation
+- **Real-time Verification**: I cross-reference information with current online sources
+- **Multi-lingual Support**: I can assist in multiple languages
+- **Policy Guidance**: Practical advice on compliance and implementation
+
+## What I Can Help You With:
+- Understanding EU Green Deal policies
+- Compliance requirements and deadlines
+- Environmental regulations and standards
+- Policy implementation strategies
+- Recent updates and changes
+
+## How I Work:
+1. I search my knowledge base of EU Green Deal documents
+2. I verify information with current online sources
+3. I provide you with accurate, up-to-date responses
+4. I cite my sources for transparency
+
+I'm here to help you navigate the complex landscape of EU environmental policy and ensure your compliance with Green Deal requirements.
+
+*I was engineered by [Emmi C.](https://emmi.zone)*
+
+**Language Support:** I can communicate in all EU official languages. Simply start our conversation in your preferred language (English, Romanian, French, German, Spanish, Italian, Polish, etc.) and I'll continue in that language throughout our session.
+""".strip()
+
+# Primary EU Green Deal source listed first for every EU answer (shared, never mutated)
+OFFICIAL_EU_SOURCE = {
+    "title": "European Green Deal - Official EU Documentation",
+    "url": "https://commission.europa.eu/publications/delivering-european-green-deal_en",
+    "type": "official_source",
+    "verified": True,
+    "description": "Official EU Commission source for Green Deal documentation"
+}
+
+# Example queries whose mean embeddings act as class centroids for semantic classification
+EU_GREEN_EXAMPLE_QUERIES = (
+    "What are the CBAM reporting obligations for importers of steel?",
+    "How does the EU Emissions Trading System reform affect aviation?",
+    "Explain the European Climate Law 2050 climate neutrality target",
+    "Which activities qualify as sustainable under the EU Taxonomy?",
+    "What does the Farm to Fork Strategy require from farmers?",
+    "When do the new CO2 emission standards for cars and vans apply?",
+    "How will the Renewable Energy Directive change national targets?",
+    "What funding is available from the Social Climate Fund?",
+    "What is the decarbonization mandate for maritime shipping under FuelEU?",
+    "How does the Circular Economy Action Plan regulate packaging waste?"
+)
+
+GENERAL_EXAMPLE_QUERIES = (
+    "Can you tell me a joke?",
+    "What is the weather like today?",
+    "How do I cook pasta?",
+    "Recommend a good movie to watch tonight",
+    "What time is it in New York?",
+    "Who won the football match yesterday?",
+    "Can you help me write a birthday message?",
+    "What is your favourite colour?",
+    "How do I learn to play the guitar?",
+    "Tell me something interesting"
+)
+
+
+# System prompt templates, formatted per request with str.format
+CASUAL_SYSTEM_PROMPT = """
+You are Verdana, a friendly and engaging EU Green Deal Compliance Assistant. 
+
+The user is making casual conversation. Respond warmly and naturally with personality:
+
+- For greetings: Greet them back enthusiastically and offer to help
+- For thanks: Acknowledge gracefully and encourage more questions
+- For testing: Be playful and supportive
+- For simple responses: Be conversational and engaging
+
+Show personality while maintaining professionalism. Be encouraging about EU Green Deal topics.
+Keep responses conversational but not too short - show some enthusiasm!
+
+Do NOT include any source listings or citations in your response.
+IMPORTANT: Respond in {language_name} language. If the user is speaking in a specific EU language, continue the conversation in that same language throughout the session.
+"""
+
+DOCS_SYSTEM_PROMPT = """
+You are Verdana, an expert EU Green Deal Compliance Assistant.
+
+{conversation_context}
+
+PRIMARY INFORMATION from EU Green Deal Documents:
+{doc_context}
+
+VERIFICATION INFORMATION from Current Sources:
+{web_context}
+
+Instructions:
+1. Answer the query using PRIMARILY the EU Green Deal documents provided
+2. Use the web verification and additional sources to confirm current information and add comprehensive details
+3. If there are any conflicts, note them and explain which source is more current
+4. Provide comprehensive, accurate information with specific details - use ALL available information sources
+5. If you mention something briefly, be prepared to elaborate if asked for more details
+6. Be proactive - combine document knowledge with web information for complete responses
+7. Format with clear headings and bullet points where appropriate
+8. Do NOT include any source listings or citations in your response text - sources are handled separately
+9. Keep response focused and well-structured
+10. Respond in {language_name} language - maintain language consistency throughout the session
+
+IMPORTANT: Be consistent - if you mention specific details in your response, ensure they are backed by your sources or clearly note when additional research would be helpful.
+
+LANGUAGE: Continue the conversation in {language_name} language as established in this session.
+
+Remember: Do NOT add "Sources:" or any source listings to your response text.
+"""
+
+WEB_ONLY_SYSTEM_PROMPT = """
+You are Verdana, an expert EU Green Deal Compliance Assistant.
+
+{conversation_context}
+
+CURRENT INFORMATION from Web Sources:
+{web_context}
+
+Instructions:
+1. Answer the query using the current web information provided
+2. Focus on official EU sources and recent information
+3. Provide comprehensive, accurate information about EU Green Deal policies
+4. Be proactive and thorough - use all available information to give detailed responses
+5. If the query asks about something specific that requires more detail, provide as much context as possible
+6. Format with clear headings and bullet points where appropriate  
+7. Do NOT include any source listings or citations in your response text - sources are handled separately
+8. If some aspects need more research, acknowledge this but still provide substantive information from available sources
+9. Connect EU Green Deal topics to broader EU policy context when relevant
+10. Respond in {language_name} language - maintain language consistency throughout the session
+
+IMPORTANT: Provide detailed, helpful responses. If you have web information about a topic, use it comprehensively rather than saying information is unavailable.
+
+LANGUAGE: Continue the conversation in {language_name} language as established in this session.
+
+Remember: Do NOT add "Sources:" or any source listings to your response text.
+"""
+
+
+def _mean_vector(vectors: List[List[float]]) -> List[float]:
+    """Element-wise mean of equally sized vectors"""
+    count = len(vectors)
+    return [sum(values) / count for values in zip(*vectors)]
+
+
+# Keyword categories checked by the query classifier
+_KEYWORD_CATEGORIES = (
+    ("identity", IDENTITY_KEYWORDS),
+    ("eu_green_deal", EU_GREEN_KEYWORDS),
+    ("policy", POLICY_KEYWORDS)
+)
+
+
+# Punctuation becomes whitespace before keyword matching ("hi!" -> "hi"); apostrophes
+# and hyphens stay since they are part of words like "what's"
+_PUNCT_TABLE = str.maketrans(
+    {char: " " for char in string.punctuation if char not in "'-"} | {"\u2019": "'"}
+)
+
+
+def _normalize_query(query: str) -> str:
+    """Casefold, drop punctuation and collapse whitespace for classification and cache keys"""
+    return " ".join(query.casefold().translate(_PUNCT_TABLE).split())
+
+
+def _build_language_identifier():
+    """Build a local language identifier limited to the supported languages"""
+    identifier = LanguageIdentifier.from_pickled_model(MODEL_FILE, norm_probs=True)
+    identifier.set_languages(list(LANGUAGE_NAMES))
+    return identifier
+
+
+# Loaded once at import; classifying a query takes well under a millisecond
+_LANGUAGE_IDENTIFIER = _build_language_identifier()
+
+
+def _build_keyword_automaton():
+    """Build an Aho-Corasick automaton mapping each keyword to its categories"""
+    keyword_categories: Dict[str, set] = {}
+    for category, keywords in _KEYWORD_CATEGORIES:
+        for keyword in keywords:
+            keyword_categories.setdefault(keyword, set()).add(category)
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, categories in keyword_categories.items():
+        automaton.add_word(keyword, frozenset(categories))
+    automaton.make_automaton()
+    return automaton
+
+
+# One automaton finds every keyword category in a single pass over the query
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+
+def _match_keyword_categories(query_lower: str) -> set:
+    """Return the keyword categories that occur in the lowercased query"""
+    matched = set()
+    for _, categories in _KEYWORD_AUTOMATON.iter(query_lower):
+        matched.update(categories)
+    return matched
+
+
+@lru_cache(maxsize=4096)
+def _classify_by_keywords(query_norm: str) -> Tuple[Optional[str], str]:
+    """
+    Apply the keyword rules to a normalized query (cached, as short queries repeat often)
+    
+    Returns the query type if the rules decide it outright (identity, greetings),
+    otherwise None, plus the keyword-based type to use when semantic
+    classification is unavailable.
+    """
+    keyword_categories = _match_keyword_categories(query_norm)
+    
+    # Check for identity queries
+    if "identity" in keyword_categories:
+        return "identity", "identity"
+    
+    word_count = len(query_norm.split())
+    
+    # Short queries that are likely casual
+    if word_count <= 3 and _CASUAL_RE.match(query_norm):
+        return "casual", "casual"
+    
+    # EU Green Deal keywords, or policy, regulation, law, directive, etc.
+    if "eu_green_deal" in keyword_categories or "policy" in keyword_categories:
+        return None, "eu_green_deal"
+    
+    # Default to EU Green Deal for longer, substantive queries
+    if word_count > 5:
+        return None, "eu_green_deal"
+    
+    return None, "casual"
+
+
+# A chunk is a near-duplicate when more than this fraction of the smaller chunk's word
+# trigrams also occur in the other: re-ingested copies, and short tail chunks lying inside
+# the previous chunk's CHUNK_OVERLAP. Ordinary neighbours share only about
+# CHUNK_OVERLAP / CHUNK_SIZE (3/8) of their text and are kept, as the rest is new
+_NEAR_DUPLICATE_CONTAINMENT = 0.8
+
+
+def _word_shingles(text: str) -> frozenset:
+    """Set of word trigrams, used to compare chunk contents"""
+    words = text.casefold().split()
+    return frozenset(zip(words, words[1:], words[2:]))
+
+
+def _select_distinct_docs(rag_results: List[Dict], limit: int) -> List[Dict]:
+    """Take the best-ranked documents, skipping near-duplicates of ones already taken"""
+    selected: List[Dict] = []
+    selected_shingles: List[frozenset] = []
+    
+    for doc in rag_results:
+        shingles = _word_shingles(doc.get("content") or "")
+        if any(
+            len(shingles & other) > _NEAR_DUPLICATE_CONTAINMENT * min(len(shingles), len(other))
+            for other in selected_shingles
+        ):
+            continue
+        
+        selected.append(doc)
+        selected_shingles.append(shingles)
+        if len(selected) >= limit:
+            break
+    
+    return selected
+
+
+def _iter_web_sources(web_results: List[Dict], source_type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield source entries for valid web results, each URL once
+    
+    Results without a title or URL, and the web search summary, are skipped.
+    Without source_type, verification results are typed "web_verification"
+    and all others "web_search".
+    """
+    seen_urls = set()
+    for result in web_results:
+        title = (result.get('title') or '').strip()
+        url = (result.get('url') or '').strip()
+        if not title or not url or title == 'Web Search Summary' or url in seen_urls:
+            continue
+        seen_urls.add(url)
+        
+        yield {
+            "title": title,
+            "url": url,
+            "type": source_type or ("web_verification" if result.get("source") == "web_search" else "web_search"),
+            "verified": True,
+            "description": "Click to view online source"
+        }
+
+
 class VerdanaAgent:
     """
     Verdana - EU Green Deal Compliance Assistant
@@ -25,46 +445,79 @@ class VerdanaAgent:
        b. If relevant docs found: verify with web search
        c. If no relevant docs: fall back to web search only
        d. Always provide structured sources for EU queries
+    
+    Not safe to instantiate more than once per process: each instance owns an
+    OpenAI connection pool and the session state. The application lifespan
+    creates the single shared instance on app.state; routes get it through
+    api.routes.chat.get_verdana_agent.
     """
     
     def __init__(self):
-        self.rag_service = RAGService()
-        self.web_service = WebService()
-        self.stt_service = STTService()
+        # Shared HTTP/2 connection pool, so concurrent requests reuse one TLS connection;
+        # chat completions, embeddings and Tavily searches all go through it
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+        )
         
-        # Initialize OpenAI client
-        self.openai_client = openai.OpenAI(
-            api_key=settings.OPENAI_API_KEY
+        self.rag_service = RAGService(http_client=self._http)
+        self.web_service = self._create_web_service()
+        
+        # Initialize async OpenAI client so LLM round-trips don't block the event loop
+        self.openai_client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=self._http,
+            max_retries=settings.OPENAI_MAX_RETRIES
         )
         
+        # Caps concurrent chat completion requests being opened (not the client-paced streaming)
+        self._llm_semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENT_REQUESTS)
+        
+        # Caps concurrent document + web search fan-outs to limit upstream pressure
+        self._search_semaphore = asyncio.Semaphore(settings.AGENT_MAX_CONCURRENT_SEARCHES)
+        
+        # Circuit breaker state: consecutive failures and when calls may resume
+        self._llm_failures = 0
+        self._llm_circuit_open_until = 0.0
+        
         # Session management
-        self.session_contexts: Dict[str, List[Dict]] = {}
+        self.session_contexts: Dict[str, Deque[Dict]] = {}
         self.session_languages: Dict[str, str] = {}  # Track detected language per session
+        # Optional Redis store so every worker sees the same sessions; the dicts
+        # above then act as this worker's copy, refreshed at the start of each query
+        self._redis = None
+        if settings.REDIS_URL:
+            self._redis = aioredis.from_url(settings.REDIS_URL)
+        # Latest background Redis write per session; each write waits for the previous one
+        self._session_writes: Dict[str, asyncio.Task] = {}
+        # Other fire-and-forget Redis writes, kept referenced until they finish
+        self._background_tasks: set = set()
         
-        # EU Green Deal keywords for query classification
-        self.eu_green_keywords = [
-            'green deal', 'eu green', 'european green', 'climate law', 'biodiversity',
-            'cbam', 'carbon border', 'farm to fork', 'circular economy', 'taxonomy',
-            'emissions trading', 'renewable energy', 'energy efficiency', 'fit for 55',
-            'climate neutral', 'net zero', 'paris agreement', 'climate change',
-            'sustainability', 'environmental policy', 'carbon footprint', 'emission',
-            'directive', 'regulation', 'compliance', 'environment', 'climate',
-            'sustainable', 'carbon', 'greenhouse gas', 'pollution', 'biodiversity',
-            'ecosystem', 'deforestation', 'reforestation', 'organic farming',
-            'pesticide', 'fertilizer', 'soil health', 'water quality', 'air quality',
-            'waste management', 'recycling', 'plastic', 'packaging', 'transport',
-            'aviation', 'maritime', 'shipping', 'electric vehicle', 'hydrogen',
-            'solar', 'wind', 'battery', 'energy storage', 'grid', 'smart city',
-            'building renovation', 'insulation', 'heat pump', 'district heating',
-            'industrial strategy', 'steel', 'cement', 'chemical', 'textile',
-            'construction', 'digital', 'artificial intelligence', 'blockchain',
-            'monitoring', 'reporting', 'verification', 'audit', 'certification',
-            'label', 'standard', 'criteria', 'threshold', 'target', 'goal',
-            'objective', 'milestone', 'timeline', 'deadline', 'implementation',
-            'transition', 'transformation', 'innovation', 'investment', 'funding',
-            'finance', 'bank', 'loan', 'subsidy', 'incentive', 'tax', 'levy',
-            'penalty', 'fine', 'enforcement', 'litigation', 'court', 'justice'
-        ]
+        # Last activity per session, least recent first, so idle sessions can be evicted
+        self._session_last_seen: "OrderedDict[str, float]" = OrderedDict()
+        
+        # Centroid embeddings for semantic query classification (computed on first use)
+        self._classifier_centroids: Optional[Tuple[List[float], List[float]]] = None
+        self._classifier_centroids_lock = asyncio.Lock()
+        
+        # LRU/TTL cache of EU Green Deal answers, keyed by normalized query + language; entries
+        # also keep the language and query embedding so similar wordings can be matched
+        self._response_cache: "OrderedDict[str, Tuple[float, Dict[str, Any], Optional[str], Optional[List[float]]]]" = OrderedDict()
+        
+        # LRU/TTL cache of web search results, matched by query embedding similarity
+        self._web_results_cache: "OrderedDict[int, Tuple[float, List[float], Tuple[List[Dict], List[Dict]]]]" = OrderedDict()
+        self._web_results_cache_next_id = 0
+    
+    def _create_web_service(self):
+        """Return the Tavily web service, or a no-op one when web research is off"""
+        if not settings.ENABLE_WEB_RESEARCH:
+            logger.info("Web research disabled, answering from documents only")
+            return NullWebService()
+        if not settings.TAVILY_API_KEY:
+            logger.warning("Tavily API key not configured, web research disabled")
+            return NullWebService()
+        return WebService(http_client=self._http)
     
     async def process_query(
         self, 
@@ -72,106 +525,378 @@ class VerdanaAgent:
         session_id: str, 
         language: str = "en"
     ) -> Dict[str, Any]:
-        """Main processing function with proper logic flow"""
+        """
+        Main processing function with proper logic flow
+        
+        Collects the events of stream_query into a single response.
+        The returned dict is serialized with orjson by the API layer, so its values
+        must stay orjson-native (str, int, float, bool, list, dict) - no numpy
+        scalars or other custom objects.
+        """
+        sources: List[Dict[str, Any]] = []
+        response_parts: List[str] = []
+        cache_hit = False
+        
+        async for event in self.stream_query(query, session_id, language):
+            if event["type"] == "sources":
+                sources = event["sources"]
+            elif event["type"] == "token":
+                response_parts.append(event["content"])
+            elif event["type"] == "done":
+                cache_hit = event["cache_hit"]
+            elif event["type"] == "error":
+                return {
+                    "response": event["response"],
+                    "sources": [],
+                    "cache_hit": False
+                }
+        
+        return {
+            "response": "".join(response_parts),
+            "sources": sources,
+            "cache_hit": cache_hit
+        }
+    
+    async def stream_query(
+        self, 
+        query: str, 
+        session_id: str, 
+        language: str = "en"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a query and stream the answer as it is generated
+        
+        Yields events in order:
+        - {"type": "sources", "sources": [...]} once sources are known (before generation)
+        - {"type": "token", "content": "..."} for each piece of response text
+        - {"type": "done", "cache_hit": bool} when the response is complete
+          (cache_hit tells a cached EU Green Deal answer from a fresh one), or
+          {"type": "error", "response": "..."} with a fallback message on failure
+        """
         
         try:
             logger.info(f"Processing query: {query[:100]}...")
             
             # Initialize session context if needed
+            self._touch_session(session_id)
+            await self._load_session(session_id)
             if session_id not in self.session_contexts:
-                self.session_contexts[session_id] = []
+                # Keep context manageable (last 20 messages, oldest dropped on append)
+                self.session_contexts[session_id] = deque(maxlen=20)
             
             # Step 1: Detect and set session language
             detected_language = await self._detect_and_set_language(query, session_id, language)
             
             # Add user query to context
-            self.session_contexts[session_id].append({
+            await self._append_session_message(session_id, {
                 "role": "user",
                 "content": query,
-                "timestamp": datetime.now(),
+                "timestamp": time.time(),
                 "language": detected_language
             })
             
-            # Step 2: Classify query type
-            query_type = await self._classify_query(query)
+            # Step 2: Classify query type and prepare the response
+            query_norm = _normalize_query(query)
+            query_type = await self._classify_query(query, query_norm)
             
             if query_type == "identity":
-                response_data = await self._handle_identity_query(query, detected_language)
+                response_plan = self._handle_identity_query(query, detected_language)
             elif query_type == "casual":
-                response_data = await self._handle_casual_query(query, detected_language)
+                response_plan = await self._handle_casual_query(query, query_norm, detected_language)
             else:  # eu_green_deal
-                response_data = await self._handle_eu_green_query(query, detected_language, session_id)
-            
-            # Add assistant response to context
-            self.session_contexts[session_id].append({
-                "role": "assistant",
-                "content": response_data["response"],
-                "timestamp": datetime.now()
-            })
-            
-            # Keep context manageable (last 20 messages)
-            if len(self.session_contexts[session_id]) > 20:
-                self.session_contexts[session_id] = self.session_contexts[session_id][-20:]
-            
-            return response_data
+                response_plan = await self._handle_eu_green_query(query, query_norm, detected_language, session_id)
             
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
-            return {
-                "response": "I apologize, but I encountered an error processing your request. Please try again.",
-                "sources": []
+            yield {
+                "type": "error",
+                "response": "I apologize, but I encountered an error processing your request. Please try again."
             }
+            return
+        
+        # While OpenAI is failing, serve a stale cached answer or fail fast
+        if "response" not in response_plan and self._llm_circuit_open():
+            stale_response = None
+            if response_plan.get("cache_key"):
+                stale_response = self._get_cached_response(response_plan["cache_key"], allow_stale=True)
+            if stale_response is None:
+                logger.warning("OpenAI circuit open, returning fallback response")
+                await self._add_assistant_message(session_id, response_plan["error_response"])
+                yield {"type": "error", "response": response_plan["error_response"]}
+                return
+            logger.warning("OpenAI circuit open, serving stale cached response")
+            response_plan = stale_response
+            response_plan["cache_hit"] = True
+        
+        # Start the completion request first so sending the sources overlaps with
+        # the model's time to first token
+        completion_task = None
+        response = None
+        if "response" not in response_plan:
+            completion_task = asyncio.create_task(self._start_completion(query, response_plan))
+        
+        try:
+            yield {"type": "sources", "sources": response_plan["sources"]}
+            
+            # Step 3: Stream the answer (prepared responses are sent as a single token)
+            if completion_task is None:
+                response_text = response_plan["response"]
+                yield {"type": "token", "content": response_text}
+            else:
+                response_parts = []
+                try:
+                    response = await completion_task
+                    async for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            delta = chunk.choices[0].delta.content
+                            response_parts.append(delta)
+                            yield {"type": "token", "content": delta}
+                except Exception as e:
+                    logger.error(f"Error generating {query_type} response: {str(e)}")
+                    self._record_llm_result(success=False)
+                    await self._add_assistant_message(session_id, response_plan["error_response"])
+                    yield {"type": "error", "response": response_plan["error_response"]}
+                    return
+                finally:
+                    # Stops generation (and billing) when the client disconnects mid-answer
+                    if response is not None:
+                        await self._close_completion(response)
+                
+                self._record_llm_result(success=True)
+                response_text = "".join(response_parts)
+                if response_plan.get("cache_key"):
+                    self._cache_response(
+                        response_plan["cache_key"],
+                        {"response": response_text, "sources": response_plan["sources"]},
+                        detected_language,
+                        response_plan.get("cache_embedding")
+                    )
+        finally:
+            if completion_task is not None:
+                # Client went away before the completion was consumed
+                if not completion_task.done():
+                    completion_task.cancel()
+                elif response is None and not completion_task.cancelled():
+                    # Opened but never read: close the stream (or retrieve the error)
+                    if completion_task.exception() is None:
+                        await self._close_completion(completion_task.result())
+        
+        await self._add_assistant_message(session_id, response_text)
+        yield {"type": "done", "cache_hit": response_plan.get("cache_hit", False)}
     
-    async def _classify_query(self, query: str) -> str:
-        """Classify query into: identity, casual, or eu_green_deal"""
+    def _llm_circuit_open(self) -> bool:
+        """Whether OpenAI calls are paused after repeated failures"""
+        return time.monotonic() < self._llm_circuit_open_until
+    
+    def _record_llm_result(self, success: bool):
+        """Track consecutive OpenAI failures, opening the circuit at the threshold"""
+        if success:
+            self._llm_failures = 0
+            return
         
-        query_lower = query.lower().strip()
+        self._llm_failures += 1
+        if self._llm_failures >= settings.OPENAI_CIRCUIT_FAIL_MAX:
+            logger.warning(
+                f"OpenAI failed {self._llm_failures} times in a row, "
+                f"pausing calls for {settings.OPENAI_CIRCUIT_RESET_TIMEOUT}s"
+            )
+            self._llm_circuit_open_until = time.monotonic() + settings.OPENAI_CIRCUIT_RESET_TIMEOUT
+            self._llm_failures = 0
+    
+    @staticmethod
+    async def _close_completion(response):
+        """Close a streamed completion's HTTP response, ending generation upstream"""
+        try:
+            await response.response.aclose()
+        except Exception as e:
+            logger.warning(f"Could not close completion stream: {e}")
+    
+    async def _start_completion(self, query: str, response_plan: Dict[str, Any]):
+        """
+        Open a streaming OpenAI completion for a prepared system prompt
         
-        # Check for identity queries
-        identity_keywords = [
-            "who are you", "what are you", "tell me about yourself",
-            "your identity", "your name", "who created you",
-            "who made you", "who built you", "who engineered you",
-            "your creator", "your developer", "about verdana"
-        ]
+        The concurrency limit covers opening the request only; reading the stream
+        is paced by the client, and slow readers must not hold up other chats.
+        """
+        async with self._llm_semaphore:
+            return await self.openai_client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": response_plan["system_prompt"]},
+                    {"role": "user", "content": query}
+                ],
+                temperature=response_plan["temperature"],
+                max_tokens=response_plan["max_tokens"],
+                stream=True
+            )
+    
+    def _touch_session(self, session_id: str):
+        """Mark a session as active and evict sessions that are idle or over the limit"""
+        now = time.monotonic()
+        self._session_last_seen[session_id] = now
+        self._session_last_seen.move_to_end(session_id)
         
-        if any(keyword in query_lower for keyword in identity_keywords):
-            return "identity"
+        while self._session_last_seen:
+            oldest_id, last_seen = next(iter(self._session_last_seen.items()))
+            if (
+                len(self._session_last_seen) <= settings.SESSION_MAX_COUNT
+                and now - last_seen <= settings.SESSION_TTL
+            ):
+                break
+            del self._session_last_seen[oldest_id]
+            self.session_contexts.pop(oldest_id, None)
+            self.session_languages.pop(oldest_id, None)
+    
+    async def _load_session(self, session_id: str):
+        """Refresh a session's history and language from Redis, when configured"""
+        if self._redis is None:
+            return
         
-        # Check for casual conversation
-        casual_patterns = [
-            r'^hi$', r'^hello$', r'^hey$', r'^good morning$', r'^good afternoon$',
-            r'^good evening$', r'^how are you', r'^what\'s up', r'^thanks?$',
-            r'^thank you$', r'^ok$', r'^okay$', r'^yes$', r'^no$', r'^bye$',
-            r'^goodbye$', r'^see you', r'^nice to meet you', r'^pleased to meet you'
-        ]
+        # Our own writes for this session must land before reading it back
+        pending_write = self._session_writes.get(session_id)
+        if pending_write is not None:
+            await asyncio.wait([pending_write])
+        
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.lrange(f"{SESSION_KEY_PREFIX}{session_id}:messages", 0, -1)
+                pipe.get(f"{SESSION_KEY_PREFIX}{session_id}:language")
+                messages, language = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not load session {session_id} from Redis: {e}")
+            return
+        
+        self.session_contexts[session_id] = deque((orjson.loads(message) for message in messages), maxlen=20)
+        if language:
+            self.session_languages[session_id] = language.decode()
+    
+    async def _append_session_message(self, session_id: str, message: Dict[str, Any]):
+        """Append a message to the session history, mirroring it to Redis when configured"""
+        if session_id not in self.session_contexts:
+            return  # Session was evicted while the response was generated
         
-        # Short queries that are likely casual
-        if len(query.split()) <= 3:
-            for pattern in casual_patterns:
-                if re.match(pattern, query_lower):
-                    return "casual"
+        self.session_contexts[session_id].append(message)
+        if self._redis is None:
+            return
         
-        # Check for EU Green Deal keywords
-        if any(keyword in query_lower for keyword in self.eu_green_keywords):
-            return "eu_green_deal"
+        # Saved in the background so replies are not held up by the Redis round-trip
+        write = asyncio.create_task(
+            self._save_session_message(session_id, message, self._session_writes.get(session_id))
+        )
+        self._session_writes[session_id] = write
+        write.add_done_callback(lambda task: self._forget_session_write(session_id, task))
+    
+    def _forget_session_write(self, session_id: str, write: asyncio.Task):
+        """Drop a finished write unless a newer one for the session replaced it"""
+        if self._session_writes.get(session_id) is write:
+            del self._session_writes[session_id]
+    
+    async def _save_session_message(
+        self, 
+        session_id: str, 
+        message: Dict[str, Any], 
+        previous_write: Optional[asyncio.Task]
+    ):
+        """Mirror a session message to Redis after the session's previous write"""
+        if previous_write is not None:
+            await asyncio.wait([previous_write])
+        
+        key = f"{SESSION_KEY_PREFIX}{session_id}:messages"
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.rpush(key, orjson.dumps(message))
+                pipe.ltrim(key, -20, -1)
+                pipe.expire(key, settings.SESSION_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not save session {session_id} to Redis: {e}")
+    
+    async def _set_session_language(self, session_id: str, language: str):
+        """Remember the session language, mirroring it to Redis when configured"""
+        self.session_languages[session_id] = language
+        if self._redis is None:
+            return
+        
+        try:
+            await self._redis.set(f"{SESSION_KEY_PREFIX}{session_id}:language", language, ex=settings.SESSION_TTL)
+        except Exception as e:
+            logger.warning(f"Could not save session {session_id} language to Redis: {e}")
+    
+    async def _add_assistant_message(self, session_id: str, content: str):
+        """Add assistant response to the session context"""
+        await self._append_session_message(session_id, {
+            "role": "assistant",
+            "content": content,
+            "timestamp": time.time()
+        })
+    
+    async def _classify_query(self, query: str, query_norm: str) -> str:
+        """Classify query into: identity, casual, or eu_green_deal"""
         
-        # If query mentions policy, regulation, law, directive, etc.
-        policy_keywords = ['policy', 'regulation', 'directive', 'law', 'compliance', 'requirement']
-        if any(keyword in query_lower for keyword in policy_keywords):
-            return "eu_green_deal"
+        rule_type, keyword_type = _classify_by_keywords(query_norm)
+        if rule_type:
+            return rule_type
         
-        # Default to EU Green Deal for longer, substantive queries
-        if len(query.split()) > 5:
-            return "eu_green_deal"
+        # Compare against EU Green Deal vs general-chat centroids; keyword rules
+        # remain the fallback when embeddings are unavailable
+        if settings.ENABLE_EMBEDDING_CLASSIFIER:
+            is_eu_query = await self._is_eu_green_query_semantic(query)
+            if is_eu_query is not None:
+                return "eu_green_deal" if is_eu_query else "casual"
         
-        return "casual"
+        return keyword_type
+    
+    async def _get_classifier_centroids(self) -> Tuple[List[float], List[float]]:
+        """Return the EU Green Deal and general-chat centroids, embedding the examples once"""
+        if self._classifier_centroids is None:
+            # Concurrent first requests wait for one embedding call instead of each making it
+            async with self._classifier_centroids_lock:
+                if self._classifier_centroids is None:
+                    embeddings = await self.rag_service.create_embeddings(
+                        list(EU_GREEN_EXAMPLE_QUERIES + GENERAL_EXAMPLE_QUERIES)
+                    )
+                    eu_count = len(EU_GREEN_EXAMPLE_QUERIES)
+                    self._classifier_centroids = (
+                        _mean_vector(embeddings[:eu_count]),
+                        _mean_vector(embeddings[eu_count:])
+                    )
+        return self._classifier_centroids
+    
+    async def _is_eu_green_query_semantic(self, query: str) -> Optional[bool]:
+        """Classify query by embedding similarity, or None if embeddings are unavailable"""
+        try:
+            eu_centroid, general_centroid = await self._get_classifier_centroids()
+            
+            # Shared with the document search, so this adds no extra API call for EU queries
+            query_embedding = await self.rag_service.embed_query(query)
+            
+        except Exception as e:
+            logger.warning(f"Semantic classification unavailable, using keywords: {e}")
+            return None
+        
+        eu_similarity = self.rag_service._calculate_cosine_similarity(query_embedding, eu_centroid)
+        general_similarity = self.rag_service._calculate_cosine_similarity(query_embedding, general_centroid)
+        
+        return eu_similarity > general_similarity
     
     async def _detect_and_set_language(self, query: str, session_id: str, default_language: str = "en") -> str:
         """Detect language from query and set for session persistence"""
         
         # If this is the first message in session, detect language
         if session_id not in self.session_languages or len(self.session_contexts.get(session_id, [])) == 0:
+            # Try the local identifier first; OpenAI is only asked when it is unsure
+            detected_lang = self._detect_language_locally(query)
+            if detected_lang:
+                await self._set_session_language(session_id, detected_lang)
+                logger.info(f"Detected language for session {session_id}: {detected_lang}")
+                return detected_lang
+            
+            # Greetings are too short to identify reliably; the canned reply is sent in
+            # the requested language rather than paying for an OpenAI call
+            if _normalize_query(query) in CANNED_INTENTS:
+                await self._set_session_language(session_id, default_language)
+                return default_language
+            
             try:
                 # Use OpenAI to detect language
                 detection_prompt = f"""
@@ -181,208 +906,380 @@ Text: "{query}"
 
 Language code:"""
                 
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",  # Use cheaper model for language detection
-                    messages=[
-                        {"role": "user", "content": detection_prompt}
-                    ],
-                    temperature=0,
-                    max_tokens=10
-                )
+                async with self._llm_semaphore:
+                    response = await self.openai_client.chat.completions.create(
+                        model="gpt-3.5-turbo",  # Use cheaper model for language detection
+                        messages=[
+                            {"role": "user", "content": detection_prompt}
+                        ],
+                        temperature=0,
+                        max_tokens=10
+                    )
                 
                 detected_lang = response.choices[0].message.content.strip().lower()
                 
                 # Validate it's a reasonable language code (2-3 characters)
-                if len(detected_lang) >= 2 and len(detected_lang) <= 3 and detected_lang.isalpha():
-                    self.session_languages[session_id] = detected_lang
+                if _LANG_RE.fullmatch(detected_lang):
+                    await self._set_session_language(session_id, detected_lang)
                     logger.info(f"Detected language for session {session_id}: {detected_lang}")
                     return detected_lang
                 else:
                     # Fallback to default
-                    self.session_languages[session_id] = default_language
+                    await self._set_session_language(session_id, default_language)
                     return default_language
                     
             except Exception as e:
                 logger.warning(f"Language detection failed: {e}, using default: {default_language}")
-                self.session_languages[session_id] = default_language
+                await self._set_session_language(session_id, default_language)
                 return default_language
         else:
             # Use previously detected language for this session
             return self.session_languages.get(session_id, default_language)
     
+    def _detect_language_locally(self, query: str) -> Optional[str]:
+        """Identify the query language in-process, or None if not confident"""
+        detected_lang, confidence = _LANGUAGE_IDENTIFIER.classify(query)
+        if confidence < settings.LANGUAGE_DETECTION_MIN_CONFIDENCE:
+            return None
+        return detected_lang
+    
     def _get_language_name(self, language_code: str) -> str:
         """Convert language code to readable name"""
-        language_names = {
-            'en': 'English',
-            'ro': 'Romanian',
-            'fr': 'French', 
-            'de': 'German',
-            'es': 'Spanish',
-            'it': 'Italian',
-            'pl': 'Polish',
-            'pt': 'Portuguese',
-            'nl': 'Dutch',
-            'da': 'Danish',
-            'sv': 'Swedish',
-            'fi': 'Finnish',
-            'el': 'Greek',
-            'hu': 'Hungarian',
-            'cs': 'Czech',
-            'sk': 'Slovak',
-            'sl': 'Slovenian',
-            'bg': 'Bulgarian',
-            'hr': 'Croatian',
-            'et': 'Estonian',
-            'lv': 'Latvian',
-            'lt': 'Lithuanian',
-            'mt': 'Maltese'
-        }
-        return language_names.get(language_code, language_code.upper())
+        return LANGUAGE_NAMES.get(language_code, language_code.upper())
     
     def _build_conversation_context(self, session_id: str, max_messages: int = 10) -> str:
-        """Build conversation context for the AI to understand previous queries"""
-        if not session_id or session_id not in self.session_contexts:
-            return ""
+        """
+        Build conversation context for the AI to understand previous queries
         
-        messages = self.session_contexts[session_id]
-        if len(messages) <= 1:  # Only current message
+        Takes the most recent messages that fit CONVERSATION_CONTEXT_TOKEN_BUDGET,
+        estimating ~4 characters per token (tiktoken is not a dependency).
+        """
+        messages = self.session_contexts.get(session_id) if session_id else None
+        if not messages or len(messages) <= 1:  # Only current message
             return ""
         
-        # Get recent conversation (excluding the current query)
-        recent_messages = messages[-max_messages-1:-1]  # Exclude the last message (current query)
-        
+        # Walk recent conversation newest first (excluding the current query)
         context_parts = []
-        for msg in recent_messages:
-            role = "User" if msg["role"] == "user" else "Assistant"
-            content = msg["content"][:200] + "..." if len(msg["content"]) > 200 else msg["content"]
-            context_parts.append(f"{role}: {content}")
+        tokens_left = settings.CONVERSATION_CONTEXT_TOKEN_BUDGET
+        for msg in islice(reversed(messages), 1, max_messages + 1):
+            content = msg["content"]
+            if len(content) > 200:
+                content = content[:200] + "..."
+            line = f"{'User' if msg['role'] == 'user' else 'Assistant'}: {content}"
+            
+            tokens_left -= len(line) // 4 + 1
+            if tokens_left < 0 and context_parts:
+                break
+            context_parts.append(line)
+        context_parts.reverse()
         
-        if context_parts:
-            return f"""
+        return f"""
 CONVERSATION HISTORY (for context):
 {chr(10).join(context_parts)}
 
 CURRENT QUERY CONTEXT: The user may be referring to previous parts of this conversation when asking questions.
 """
-        return ""
     
-    async def _handle_casual_query(self, query: str, language: str) -> Dict[str, Any]:
-        """Handle casual conversation without sources"""
-        
-        system_prompt = f"""
-You are Verdana, a friendly and engaging EU Green Deal Compliance Assistant. 
-
-The user is making casual conversation. Respond warmly and naturally with personality:
-
-- For greetings: Greet them back enthusiastically and offer to help
-- For thanks: Acknowledge gracefully and encourage more questions
-- For testing: Be playful and supportive
-- For simple responses: Be conversational and engaging
-
-Show personality while maintaining professionalism. Be encouraging about EU Green Deal topics.
-Keep responses conversational but not too short - show some enthusiasm!
-
-Do NOT include any source listings or citations in your response.
-IMPORTANT: Respond in {self._get_language_name(language)} language. If the user is speaking in a specific EU language, continue the conversation in that same language throughout the session.
-        """
+    async def _handle_casual_query(self, query: str, query_norm: str, language: str) -> Dict[str, Any]:
+        """Prepare casual conversation response without sources"""
         
-        try:
-            response = self.openai_client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                temperature=0.7,
-                max_tokens=200  # Keep casual responses short
-            )
-            
+        # Plain greetings, thanks and goodbyes get a prepared reply, no LLM call needed
+        canned_response = CANNED_RESPONSES.get((language, CANNED_INTENTS.get(query_norm)))
+        if canned_response:
             return {
-                "response": response.choices[0].message.content,
-                "sources": []
-            }
-            
-        except Exception as e:
-            logger.error(f"Error handling casual query: {str(e)}")
-            return {
-                "response": "Hello! I'm here to help you with EU Green Deal policies and compliance questions. How can I assist you today?",
+                "response": canned_response,
                 "sources": []
             }
+        
+        return {
+            "system_prompt": CASUAL_SYSTEM_PROMPT.format(language_name=self._get_language_name(language)),
+            "temperature": 0.7,
+            "max_tokens": 200,  # Keep casual responses short
+            "sources": [],
+            "error_response": "Hello! I'm here to help you with EU Green Deal policies and compliance questions. How can I assist you today?"
+        }
     
-    async def _handle_identity_query(self, query: str, language: str) -> Dict[str, Any]:
+    def _handle_identity_query(self, query: str, language: str) -> Dict[str, Any]:
         """Handle queries about agent identity"""
-        
-        identity_response = f"""
-I am **{settings.AGENT_NAME}**, your EU Green Deal Compliance Assistant. My name reflects my expertise in green ("verde") policy analysis ("ana").
-
-## My Capabilities:
-- **EU Green Deal Expertise**: Deep knowledge of EU environmental policies and regulations
-- **Document Analysis**: Access to comprehensive EU Green Deal documentation
-- **Real-time Verification**: I cross-reference information with current online sources
-- **Multi-lingual Support**: I can assist in multiple languages
-- **Policy Guidance**: Practical advice on compliance and implementation
-
-## What I Can Help You With:
-- Understanding EU Green Deal policies
-- Compliance requirements and deadlines
-- Environmental regulations and standards
-- Policy implementation strategies
-- Recent updates and changes
-
-## How I Work:
-1. I search my knowledge base of EU Green Deal documents
-2. I verify information with current online sources
-3. I provide you with accurate, up-to-date responses
-4. I cite my sources for transparency
-
-I'm here to help you navigate the complex landscape of EU environmental policy and ensure your compliance with Green Deal requirements.
-
-*I was engineered by [Emmi C.](https://emmi.zone)*
-
-**Language Support:** I can communicate in all EU official languages. Simply start our conversation in your preferred language (English, Romanian, French, German, Spanish, Italian, Polish, etc.) and I'll continue in that language throughout our session.
-        """.strip()
-        
         return {
-            "response": identity_response,
+            "response": IDENTITY_RESPONSE,
             "sources": []  # No sources needed for identity
         }
     
-    async def _handle_eu_green_query(self, query: str, language: str, session_id: str) -> Dict[str, Any]:
-        """Handle EU Green Deal specific queries with proper workflow"""
-        
-        # Step 1: Search embedded documents
-        logger.info("Searching embedded documents...")
-        rag_results = await self.rag_service.search_documents(query)
-        
-        # Step 2: Determine if there are good document matches
-        has_relevant_docs = (
-            len(rag_results) > 0 and 
-            any(doc.get('similarity', 0) > 0.3 for doc in rag_results)
-        )
+    async def _handle_eu_green_query(
+        self, 
+        query: str, 
+        query_norm: str, 
+        language: str, 
+        session_id: str
+    ) -> Dict[str, Any]:
+        """Prepare EU Green Deal specific response with proper workflow"""
         
-        # Step 3: Always get comprehensive web search for all queries
-        logger.info("Getting web verification/additional information...")
-        web_results = await self.web_service.search_for_verification(query)
+        # Serve repeated questions from the cache (only without prior conversation,
+        # since the answer would otherwise depend on the session history)
+        conversation_context = self._build_conversation_context(session_id)
+        cache_key = None
+        query_embedding = None
+        if not conversation_context:
+            cache_key = self._response_cache_key(query_norm, language)
+            cached_response = await self._lookup_cached_response(cache_key)
+            if cached_response is None:
+                # The embedding is reused by the document and web searches, so this adds no API call
+                try:
+                    query_embedding = await self.rag_service.embed_query(query)
+                    cached_response = await self._get_similar_cached_response(query_embedding, language)
+                except Exception as e:
+                    logger.warning(f"Response cache similarity lookup failed: {e}")
+            if cached_response:
+                logger.info("Serving cached response for query")
+                cached_response["cache_hit"] = True
+                return cached_response
         
-        # Also get broader web search for comprehensive coverage
-        logger.info("Getting additional comprehensive web search...")
-        enhanced_web_results = await self.web_service.search_current_news(query)
+        async with self._search_semaphore:
+            # Start web verification + broader web search in the background so they
+            # overlap with the document search instead of running after it
+            logger.debug("Getting web verification and comprehensive web search...")
+            web_searches = asyncio.create_task(self._search_web(query))
+            
+            # Step 1: Search embedded documents
+            logger.debug("Searching embedded documents...")
+            rag_results = await self.rag_service.search_documents(query)
+            
+            # Step 2: Determine if there are good document matches
+            has_relevant_docs = (
+                len(rag_results) > 0 and 
+                any(doc.get('similarity', 0) > 0.3 for doc in rag_results)
+            )
+            
+            # Step 3: Always get comprehensive web search for all queries
+            web_results, enhanced_web_results = await web_searches
         
         # Combine and log results
         all_web_results = web_results + enhanced_web_results
         logger.info(f"Combined web search results: {len(web_results)} verification + {len(enhanced_web_results)} broader = {len(all_web_results)} total")
         
-        # Step 4: Generate response based on available information
+        # Step 4: Prepare response based on available information
         if has_relevant_docs:
             # Use embedded docs as primary source + comprehensive web search
-            return await self._generate_response_with_docs(
-                query, rag_results, all_web_results, language, session_id
+            response_plan = await self._generate_response_with_docs(
+                query, rag_results, all_web_results, language, conversation_context
             )
         else:
             # Use the comprehensive web results already obtained
-            return await self._generate_response_web_only(
-                query, all_web_results, language, session_id
+            response_plan = await self._generate_response_web_only(
+                query, all_web_results, language, conversation_context
+            )
+        
+        # The answer is cached once it has been generated successfully
+        response_plan["cache_key"] = cache_key
+        response_plan["cache_embedding"] = query_embedding
+        return response_plan
+    
+    async def _search_web(self, query: str) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Run EU-domain verification and broader web searches concurrently
+        
+        Broader results whose URL was already returned by the verification
+        search are dropped, so the merged list holds each page once. Results
+        for a query worded like a recent one are served from the cache.
+        """
+        # The query embedding is shared with the document search, so this adds no API call
+        query_embedding = None
+        try:
+            query_embedding = await self.rag_service.embed_query(query)
+            cached_results = await self._get_cached_web_results(query_embedding)
+            if cached_results is not None:
+                logger.info("Serving cached web results for similar query")
+                return cached_results
+        except Exception as e:
+            logger.warning(f"Web results cache lookup failed: {e}")
+        
+        verification_results, broader_results = await asyncio.gather(
+            self.web_service.search_for_verification(query),
+            self.web_service.search_current_news(query),
+            return_exceptions=True
+        )
+        
+        # One failed search should not discard the other's results
+        if isinstance(verification_results, Exception):
+            logger.error(f"Web verification search failed: {verification_results}")
+            verification_results = []
+        if isinstance(broader_results, Exception):
+            logger.error(f"Broader web search failed: {broader_results}")
+            broader_results = []
+        
+        seen_urls = {result.get("url") for result in verification_results if result.get("url")}
+        broader_results = [
+            result for result in broader_results
+            if not result.get("url") or result["url"] not in seen_urls
+        ]
+        
+        if query_embedding is not None and (verification_results or broader_results):
+            self._cache_web_results(query_embedding, (verification_results, broader_results))
+        return verification_results, broader_results
+    
+    async def _get_cached_web_results(self, query_embedding: List[float]) -> Optional[Tuple[List[Dict], List[Dict]]]:
+        """Return unexpired web results of the most similar cached query, if similar enough"""
+        now = time.monotonic()
+        entries = [
+            (entry_id, embedding)
+            for entry_id, (cached_at, embedding, _) in self._web_results_cache.items()
+            if now - cached_at <= settings.WEB_SEARCH_CACHE_TTL
+        ]
+        if not entries:
+            return None
+        
+        # Comparing against every cached embedding is CPU work, so keep it off the event loop
+        entry_id = await asyncio.to_thread(
+            self._find_similar_embedding, query_embedding, entries, settings.WEB_SEARCH_CACHE_SIMILARITY
+        )
+        entry = self._web_results_cache.get(entry_id)
+        if entry is None:
+            return None
+        
+        self._web_results_cache.move_to_end(entry_id)
+        verification_results, broader_results = entry[2]
+        return list(verification_results), list(broader_results)
+    
+    def _find_similar_embedding(
+        self, 
+        query_embedding: List[float], 
+        entries: List[Tuple[Any, List[float]]],
+        threshold: float
+    ) -> Optional[Any]:
+        """Id of the cached query most similar to the embedding, if at or above the threshold"""
+        query_magnitude = math.hypot(*query_embedding)
+        best_id, best_similarity = None, threshold
+        for entry_id, embedding in entries:
+            similarity = self.rag_service._cosine_similarity_with_magnitude(query_embedding, query_magnitude, embedding)
+            if similarity >= best_similarity:
+                best_id, best_similarity = entry_id, similarity
+        return best_id
+    
+    def _cache_web_results(self, query_embedding: List[float], web_results: Tuple[List[Dict], List[Dict]]):
+        """Store web results for a query embedding, evicting the least recently used entries"""
+        self._web_results_cache_next_id += 1
+        self._web_results_cache[self._web_results_cache_next_id] = (time.monotonic(), query_embedding, web_results)
+        while len(self._web_results_cache) > settings.WEB_SEARCH_CACHE_SIZE:
+            self._web_results_cache.popitem(last=False)
+    
+    def _response_cache_key(self, query_norm: str, language: str) -> str:
+        """
+        Build cache key from normalized query and language
+        
+        Retrieved chunks are not part of the key: document search samples
+        chunks at random, so they differ between calls for the same question.
+        Knowledge base changes are picked up when entries expire.
+        """
+        return hashlib.blake2b(f"{query_norm}\x00{language}".encode(), digest_size=16).hexdigest()
+    
+    def _get_cached_response(self, cache_key: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached response if present and not expired
+        
+        Expired entries are kept until LRU eviction so they can still be served
+        with allow_stale=True while OpenAI is unavailable.
+        """
+        entry = self._response_cache.get(cache_key)
+        if entry is None:
+            return None
+        
+        cached_at, response_data = entry[:2]
+        if not allow_stale and time.monotonic() - cached_at > settings.RESPONSE_CACHE_TTL:
+            return None
+        
+        self._response_cache.move_to_end(cache_key)
+        return {**response_data, "sources": list(response_data["sources"])}
+    
+    async def _get_similar_cached_response(self, query_embedding: List[float], language: str) -> Optional[Dict[str, Any]]:
+        """Return the unexpired cached response of the most similar query in the same language"""
+        now = time.monotonic()
+        entries = [
+            (cache_key, embedding)
+            for cache_key, (cached_at, _, entry_language, embedding) in self._response_cache.items()
+            if embedding is not None and entry_language == language
+            and now - cached_at <= settings.RESPONSE_CACHE_TTL
+        ]
+        if not entries:
+            return None
+        
+        cache_key = await asyncio.to_thread(
+            self._find_similar_embedding, query_embedding, entries, settings.RESPONSE_CACHE_SIMILARITY
+        )
+        return self._get_cached_response(cache_key) if cache_key is not None else None
+    
+    async def _lookup_cached_response(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached response from this worker's cache, falling back to Redis"""
+        cached_response = self._get_cached_response(cache_key)
+        if cached_response is not None or self._redis is None:
+            return cached_response
+        
+        try:
+            cached_data = await self._redis.get(f"{RESPONSE_CACHE_KEY_PREFIX}{cache_key}")
+        except Exception as e:
+            logger.warning(f"Could not read cached response from Redis: {e}")
+            return None
+        if cached_data is None:
+            return None
+        
+        # Keep a local copy so repeats on this worker skip Redis (exact matches only,
+        # as the embedding is not shared)
+        self._store_cached_response(cache_key, orjson.loads(cached_data), None, None)
+        return self._get_cached_response(cache_key)
+    
+    def _cache_response(
+        self, 
+        cache_key: str, 
+        response_data: Dict[str, Any], 
+        language: str, 
+        query_embedding: Optional[List[float]]
+    ):
+        """Store a response locally and, when configured, in Redis for the other workers"""
+        self._store_cached_response(cache_key, response_data, language, query_embedding)
+        if self._redis is None:
+            return
+        
+        task = asyncio.create_task(self._save_cached_response(cache_key, response_data))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _save_cached_response(self, cache_key: str, response_data: Dict[str, Any]):
+        """Write a response to Redis with the cache TTL"""
+        try:
+            await self._redis.set(
+                f"{RESPONSE_CACHE_KEY_PREFIX}{cache_key}",
+                orjson.dumps(response_data),
+                ex=settings.RESPONSE_CACHE_TTL
             )
+        except Exception as e:
+            logger.warning(f"Could not save cached response to Redis: {e}")
+    
+    def _store_cached_response(
+        self, 
+        cache_key: str, 
+        response_data: Dict[str, Any], 
+        language: Optional[str], 
+        query_embedding: Optional[List[float]]
+    ):
+        """Store a response in this worker's cache, evicting the least recently used entries"""
+        self._response_cache[cache_key] = (time.monotonic(), response_data, language, query_embedding)
+        self._response_cache.move_to_end(cache_key)
+        while len(self._response_cache) > settings.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
+    @staticmethod
+    def _truncate_content(content: str, max_chars: int) -> str:
+        """Cut content to max_chars, marking it with an ellipsis only when shortened"""
+        content = content or ""
+        return content[:max_chars] + "..." if len(content) > max_chars else content
+    
+    def _format_web_context(self, web_results: List[Dict], max_chars: int) -> str:
+        """Format web results for the system prompt, skipping the web search summary"""
+        return "\n\n".join(
+            f"Source: {result['title']}\nContent: {self._truncate_content(result.get('content'), max_chars)}"
+            for result in web_results
+            if result.get('title') != 'Web Search Summary'
+        )
     
     async def _generate_response_with_docs(
         self, 
@@ -390,245 +1287,145 @@ I'm here to help you navigate the complex landscape of EU environmental policy a
         rag_results: List[Dict], 
         web_results: List[Dict], 
         language: str,
-        session_id: str = None
+        conversation_context: str = ""
     ) -> Dict[str, Any]:
-        """Generate response using embedded documents + web verification"""
-        
-        # Build conversation context
-        conversation_context = self._build_conversation_context(session_id) if session_id else ""
+        """Prepare prompt and sources for a response using embedded documents + web verification"""
         
         # Build context from top RAG results (optimized for performance)
-        doc_context = "\n\n".join([
-            f"Document: {doc['title']}\nContent: {doc['content'][:600]}..."
-            for doc in rag_results[:2]  # Reduced from 3 to 2 documents
-        ])
+        doc_context = "\n\n".join(
+            f"Document: {doc['title']}\nContent: {self._truncate_content(doc['content'], 600)}"
+            for doc in _select_distinct_docs(rag_results, 2)  # Reduced from 3 to 2 documents
+        )
         
         # Build verification context from web results (excluding web summary)
-        web_context = "\n\n".join([
-            f"Source: {result['title']}\nContent: {result['content'][:300]}..."
-            for result in web_results[:2]  # Reduced from 3 to 2 sources
-            if result.get('title') != 'Web Search Summary'
-        ])
+        web_context = self._format_web_context(web_results[:2], 300)  # Reduced from 3 to 2 sources
         
-        system_prompt = f"""
-You are Verdana, an expert EU Green Deal Compliance Assistant.
-
-{conversation_context}
-
-PRIMARY INFORMATION from EU Green Deal Documents:
-{doc_context}
-
-VERIFICATION INFORMATION from Current Sources:
-{web_context}
-
-Instructions:
-1. Answer the query using PRIMARILY the EU Green Deal documents provided
-2. Use the web verification and additional sources to confirm current information and add comprehensive details
-3. If there are any conflicts, note them and explain which source is more current
-4. Provide comprehensive, accurate information with specific details - use ALL available information sources
-5. If you mention something briefly, be prepared to elaborate if asked for more details
-6. Be proactive - combine document knowledge with web information for complete responses
-7. Format with clear headings and bullet points where appropriate
-8. Do NOT include any source listings or citations in your response text - sources are handled separately
-9. Keep response focused and well-structured
-10. Respond in {self._get_language_name(language)} language - maintain language consistency throughout the session
-
-IMPORTANT: Be consistent - if you mention specific details in your response, ensure they are backed by your sources or clearly note when additional research would be helpful.
-
-LANGUAGE: Continue the conversation in {self._get_language_name(language)} language as established in this session.
-
-Remember: Do NOT add "Sources:" or any source listings to your response text.
-        """
+        system_prompt = DOCS_SYSTEM_PROMPT.format(
+            conversation_context=conversation_context,
+            doc_context=doc_context,
+            web_context=web_context,
+            language_name=self._get_language_name(language)
+        )
         
-        try:
-            response = self.openai_client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                temperature=settings.OPENAI_TEMPERATURE,
-                max_tokens=settings.OPENAI_MAX_TOKENS
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-            # Build structured sources
-            sources = []
+        # Build structured sources
+        # Always add the primary EU Green Deal source first
+        sources = [OFFICIAL_EU_SOURCE]
+        
+        # Add document sources with deduplication by document
+        added_docs = set()  # Track added documents to prevent duplicates
+        for doc in rag_results[:5]:  # Check more docs but deduplicate
+            doc_key = doc.get("filename") or doc.get("document_id") or doc.get("id")
+            if doc_key in added_docs:
+                continue
             
-            # Always add the primary EU Green Deal source first
+            added_docs.add(doc_key)
             sources.append({
-                "title": "European Green Deal - Official EU Documentation",
-                "url": "https://commission.europa.eu/publications/delivering-european-green-deal_en",
-                "type": "official_source",
+                "title": doc["title"],
+                "type": "knowledge_base",
+                "filename": doc.get("filename"),
+                "similarity": round(float(doc.get("similarity", 0)), 2),
                 "verified": True,
-                "description": "Official EU Commission source for Green Deal documentation"
+                "description": f"Internal document - {doc.get('filename', 'PDF file')}"
             })
-            
-            # Add document sources with deduplication by filename
-            added_docs = set()  # Track added documents to prevent duplicates
-            for doc in rag_results[:5]:  # Check more docs but deduplicate
-                filename = doc.get("filename", doc.get("title", "Unknown"))
-                if filename not in added_docs:
-                    added_docs.add(filename)
-                    sources.append({
-                        "title": doc["title"],
-                        "type": "knowledge_base",
-                        "filename": doc.get("filename"),
-                        "similarity": round(doc.get("similarity", 0), 2),
-                        "verified": True,
-                        "description": f"Internal document - {doc.get('filename', 'PDF file')}"
-                    })
-                    if len([s for s in sources if s.get("type") == "knowledge_base"]) >= 3:
-                        break  # Limit to 3 unique documents
-            
-            # Add web sources with better validation and deduplication
-            added_urls = set()  # Track URLs to prevent duplicates
-            web_source_count = 0
-            
-            logger.info(f"Processing {len(web_results)} web results for sources")
-            
-            for result in web_results:
-                # Validate web result
-                title = result.get('title', '').strip()
-                url = result.get('url', '').strip()
-                
-                # Skip invalid results
-                if not title or not url or title == 'Web Search Summary':
-                    continue
-                    
-                # Skip duplicates
-                if url in added_urls:
-                    continue
-                    
-                added_urls.add(url)
-                
-                # Determine source type based on origin
-                source_type = "web_verification" if result.get("source") == "web_search" else "web_search"
-                
-                sources.append({
-                    "title": title,
-                    "url": url,
-                    "type": source_type, 
-                    "verified": True,
-                    "description": "Click to view online source"
-                })
-                
-                web_source_count += 1
-                if web_source_count >= 5:  # Limit web sources
-                    break
-            
-            logger.info(f"Added {web_source_count} web sources to response")
-            
-            return {
-                "response": ai_response,
-                "sources": sources
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating response with docs: {str(e)}")
-            return {
-                "response": "I apologize, but I'm having trouble accessing the information right now. Please try again.",
-                "sources": []
-            }
+            if len(added_docs) >= 3:
+                break  # Limit to 3 unique documents
+        
+        # Add validated, deduplicated web sources (limit 5)
+        logger.debug(f"Processing {len(web_results)} web results for sources")
+        web_sources = list(islice(_iter_web_sources(web_results), 5))
+        sources.extend(web_sources)
+        
+        logger.info(f"Added {len(web_sources)} web sources to response")
+        
+        return {
+            "system_prompt": system_prompt,
+            "temperature": settings.OPENAI_TEMPERATURE,
+            "max_tokens": settings.OPENAI_MAX_TOKENS,
+            "sources": sources,
+            "error_response": "I apologize, but I'm having trouble accessing the information right now. Please try again."
+        }
     
     async def _generate_response_web_only(
         self, 
         query: str, 
         web_results: List[Dict], 
         language: str,
-        session_id: str = None
+        conversation_context: str = ""
     ) -> Dict[str, Any]:
-        """Generate response using web search only (fallback)"""
-        
-        # Build conversation context
-        conversation_context = self._build_conversation_context(session_id) if session_id else ""
+        """Prepare prompt and sources for a response using web search only (fallback)"""
         
         # Build context from web results (excluding web summary)
-        web_context = "\n\n".join([
-            f"Source: {result['title']}\nContent: {result['content'][:600]}..."
-            for result in web_results[:4]
-            if result.get('title') != 'Web Search Summary'
-        ])
+        web_context = self._format_web_context(web_results[:4], 600)
         
-        system_prompt = f"""
-You are Verdana, an expert EU Green Deal Compliance Assistant.
-
-{conversation_context}
-
-CURRENT INFORMATION from Web Sources:
-{web_context}
-
-Instructions:
-1. Answer the query using the current web information provided
-2. Focus on official EU sources and recent information
-3. Provide comprehensive, accurate information about EU Green Deal policies
-4. Be proactive and thorough - use all available information to give detailed responses
-5. If the query asks about something specific that requires more detail, provide as much context as possible
-6. Format with clear headings and bullet points where appropriate  
-7. Do NOT include any source listings or citations in your response text - sources are handled separately
-8. If some aspects need more research, acknowledge this but still provide substantive information from available sources
-9. Connect EU Green Deal topics to broader EU policy context when relevant
-10. Respond in {self._get_language_name(language)} language - maintain language consistency throughout the session
-
-IMPORTANT: Provide detailed, helpful responses. If you have web information about a topic, use it comprehensively rather than saying information is unavailable.
-
-LANGUAGE: Continue the conversation in {self._get_language_name(language)} language as established in this session.
-
-Remember: Do NOT add "Sources:" or any source listings to your response text.
+        system_prompt = WEB_ONLY_SYSTEM_PROMPT.format(
+            conversation_context=conversation_context,
+            web_context=web_context,
+            language_name=self._get_language_name(language)
+        )
+        
+        # Build structured sources (exclude web summary)
+        # Always add the primary EU Green Deal source first
+        sources = [OFFICIAL_EU_SOURCE]
+        
+        # Add web search sources, skipping URLs already listed
+        sources.extend(_iter_web_sources(web_results[:4], source_type="web_search"))
+        
+        return {
+            "system_prompt": system_prompt,
+            "temperature": settings.OPENAI_TEMPERATURE,
+            "max_tokens": settings.OPENAI_MAX_TOKENS,
+            "sources": sources,
+            "error_response": "I apologize, but I'm having trouble accessing current information. Please try again."
+        }
+    
+    @cached_property
+    def stt_service(self) -> STTService:
+        """Speech-to-text service, created on first audio request"""
+        return STTService(http_client=self._http, redis_client=self._redis)
+    
+    async def process_audio(self, audio_file: bytes) -> str:
+        """Process audio input using STT service"""
+        return await self.stt_service.transcribe_audio(audio_file)
+    
+    async def warm(self):
         """
+        Prepare connections and classifier state before the first request
+        
+        Opens the OpenAI connection and the database pool, and embeds the
+        classifier examples. Failures are logged and left to be retried lazily.
+        """
+        async def warm_database():
+            conn = await self.rag_service._get_db_connection()
+            await self.rag_service._release_db_connection(conn)
+        
+        warmups = {
+            "openai": self.openai_client.models.list(),
+            "database": warm_database()
+        }
+        if settings.ENABLE_EMBEDDING_CLASSIFIER:
+            warmups["classifier"] = self._get_classifier_centroids()
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                temperature=settings.OPENAI_TEMPERATURE,
-                max_tokens=settings.OPENAI_MAX_TOKENS
+            results = await asyncio.wait_for(
+                asyncio.gather(*warmups.values(), return_exceptions=True),
+                timeout=settings.AGENT_WARMUP_TIMEOUT
             )
-            
-            ai_response = response.choices[0].message.content
-            
-            # Build structured sources (exclude web summary)
-            sources = []
-            
-            # Always add the primary EU Green Deal source first
-            sources.append({
-                "title": "European Green Deal - Official EU Documentation",
-                "url": "https://commission.europa.eu/publications/delivering-european-green-deal_en",
-                "type": "official_source",
-                "verified": True,
-                "description": "Official EU Commission source for Green Deal documentation"
-            })
-            
-            # Add web search sources
-            for result in web_results[:4]:
-                title = result.get('title', '').strip()
-                url = result.get('url', '').strip()
-                
-                if title != 'Web Search Summary' and url:
-                    sources.append({
-                        "title": title,
-                        "url": url,
-                        "type": "web_search",
-                        "verified": True,
-                        "description": "Click to view online source"
-                    })
-            
-            return {
-                "response": ai_response,
-                "sources": sources
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating web-only response: {str(e)}")
-            return {
-                "response": "I apologize, but I'm having trouble accessing current information. Please try again.",
-                "sources": []
-            }
+        except asyncio.TimeoutError:
+            logger.warning(f"Agent warm-up timed out after {settings.AGENT_WARMUP_TIMEOUT}s")
+            return
+        
+        for name, result in zip(warmups, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Agent warm-up of {name} failed: {result}")
+        logger.info("Agent warm-up finished")
     
-    async def process_audio(self, audio_file: bytes) -> str:
-        """Process audio input using STT service"""
-        return await self.stt_service.transcribe_audio(audio_file)
\ No newline at end of file
+    async def aclose(self):
+        """Close the shared OpenAI HTTP and database connection pools"""
+        await self.web_service.aclose()
+        await self.rag_service.aclose()
+        await self._http.aclose()
+        if self._redis is not None:
+            pending_writes = [*self._session_writes.values(), *self._background_tasks]
+            if pending_writes:
+                await asyncio.wait(pending_writes)
+            await self._redis.aclose()
\ No newline at end of file
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
+import orjson
 
 from agents.verdana_agent import VerdanaAgent
 from services.stt_service import STTService
@@ -11,6 +13,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Upload content types accepted for speech-to-text (by their top-level type)
+AUDIO_MEDIA_TYPES = frozenset({"audio", "video"})
+
 
 class ChatMessage(BaseModel):
     message: str
@@ -24,15 +29,24 @@ class ChatResponse(BaseModel):
     session_id: str
     timestamp: datetime
     sources: List[Dict[str, Any]] = []
+    cache_hit: bool = False
+
+
+def get_verdana_agent(request: Request) -> VerdanaAgent:
+    """Return the shared agent created in the application lifespan"""
+    return request.app.state.verdana_agent
 
 
-# Initialize agent and services
-verdana_agent = VerdanaAgent()
-stt_service = STTService()
+def get_stt_service(request: Request) -> STTService:
+    """Return the agent's speech-to-text service, sharing its OpenAI connection pool"""
+    return request.app.state.verdana_agent.stt_service
 
 
 @router.post("/message", response_model=ChatResponse)
-async def send_message(request: ChatMessage):
+async def send_message(
+    request: ChatMessage,
+    verdana_agent: VerdanaAgent = Depends(get_verdana_agent)
+):
     """Handle chat message from frontend"""
     try:
         logger.info(f"Received message for session {request.session_id}")
@@ -54,8 +68,9 @@ async def send_message(request: ChatMessage):
         return ChatResponse(
             response=response_data["response"],
             session_id=request.session_id,
-            timestamp=datetime.now(),
-            sources=response_data.get("sources", [])
+            timestamp=datetime.now(timezone.utc),
+            sources=response_data.get("sources", []),
+            cache_hit=response_data.get("cache_hit", False)
         )
         
     except Exception as e:
@@ -66,8 +81,41 @@ async def send_message(request: ChatMessage):
         )
 
 
+@router.post("/message/stream")
+async def stream_message(
+    request: ChatMessage,
+    verdana_agent: VerdanaAgent = Depends(get_verdana_agent)
+):
+    """Stream chat response to the frontend as server-sent events"""
+    logger.info(f"Received streaming message for session {request.session_id}")
+    
+    # Check AI consent
+    if not request.ai_consent:
+        raise HTTPException(
+            status_code=403,
+            detail="AI consent required"
+        )
+    
+    async def event_stream():
+        async for event in verdana_agent.stream_query(
+            query=request.message,
+            session_id=request.session_id,
+            language=request.language
+        ):
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/speech-to-text")
-async def speech_to_text(audio: UploadFile = File(...)):
+async def speech_to_text(
+    audio: UploadFile = File(...),
+    stt_service: STTService = Depends(get_stt_service)
+):
     """Convert speech to text using OpenAI Whisper"""
     try:
         logger.info(f"Received audio file: {audio.filename}, content_type: {audio.content_type}")
@@ -80,23 +128,22 @@ async def speech_to_text(audio: UploadFile = File(...)):
             )
         
         # Check file format
-        if audio.content_type and not any(fmt in audio.content_type for fmt in ["audio", "video"]):
+        if audio.content_type and audio.content_type.partition("/")[0] not in AUDIO_MEDIA_TYPES:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid file format. Please upload an audio file."
             )
         
-        # Read audio data
-        audio_data = await audio.read()
-        
-        if not audio_data:
+        # The size is counted while the upload is spooled
+        if audio.size == 0:
             raise HTTPException(
                 status_code=400,
                 detail="Empty audio file"
             )
         
-        # Transcribe audio
-        transcribed_text = await stt_service.transcribe_audio(audio_data)
+        # Transcribe straight from the spooled upload (kept on disk past 1 MB)
+        # instead of reading the whole file into memory first
+        transcribed_text = await stt_service.transcribe_stream(audio.file)
         
         return {
             "text": transcribed_text,
@@ -1,11 +1,24 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timezone
+import time
 from core.config import settings
 
 
 router = APIRouter()
 
+# Health probes arrive every few seconds per pod, so the timestamp is built once per second
+_timestamp_cache = (0, datetime.fromtimestamp(0, timezone.utc))
+
+
+def _now_utc_cached() -> datetime:
+    """Current UTC time truncated to the second, rebuilt at most once per second"""
+    global _timestamp_cache
+    second = int(time.time())
+    if _timestamp_cache[0] != second:
+        _timestamp_cache = (second, datetime.fromtimestamp(second, timezone.utc))
+    return _timestamp_cache[1]
+
 
 class HealthResponse(BaseModel):
     status: str
@@ -19,7 +32,7 @@ async def health_check():
     """Health check endpoint"""
     return HealthResponse(
         status="healthy",
-        timestamp=datetime.now(),
+        timestamp=_now_utc_cached(),
         version="2.0.0",
         agent_name=settings.AGENT_NAME
     )
\ No newline at end of file
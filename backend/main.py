@@ -1,28 +1,39 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import uvicorn
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 
 from core.config import settings
 from core.logging import setup_logging
+from agents.verdana_agent import VerdanaAgent
 from api.routes.chat import router as chat_router
 from api.routes.health import router as health_router
 
+logger = logging.getLogger(__name__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler"""
     # Startup
     setup_logging()
+    # uvicorn picks uvloop when installed (uvicorn[standard] on Linux); log it to confirm
+    logger.info(f"Event loop: {type(asyncio.get_running_loop()).__module__}")
+    app.state.verdana_agent = VerdanaAgent()
+    await app.state.verdana_agent.warm()
     yield
-    # Shutdown (cleanup if needed)
+    # Shutdown
+    await app.state.verdana_agent.aclose()
 
 
 app = FastAPI(
     title="EU Green Policies Chatbot API",
     description="Backend API for Verdana - EU Green Deal Compliance Assistant",
     version="2.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -43,7 +54,7 @@ app.include_router(chat_router, prefix="/api/chat", tags=["chat"])
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     """Global exception handler"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
     )
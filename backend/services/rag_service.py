@@ -3,8 +3,12 @@ import logging
 import hashlib
 import re
 import json
+import math
+import operator
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
+import httpx
 import openai
 import asyncpg
 from core.config import settings
@@ -23,8 +27,13 @@ class RAGService:
     - Storage: PostgreSQL with pgvector extension
     """
     
-    def __init__(self):
-        self.openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        # Reuses the caller's connection pool when given one (e.g. the agent's HTTP/2 client)
+        self.openai_client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=http_client,
+            max_retries=settings.OPENAI_MAX_RETRIES
+        )
         self.embedding_model = settings.OPENAI_EMBEDDING_MODEL
         self.chunk_size = settings.CHUNK_SIZE
         self.chunk_overlap = settings.CHUNK_OVERLAP
@@ -32,20 +41,38 @@ class RAGService:
         
         # Database connection will be managed per request
         self._db_pool = None
+        self._db_pool_lock = asyncio.Lock()
+        
+        # Recent query embeddings, so query classification and search share one API call
+        self._query_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_embedding_cache_size = 256
+        
+        # Query embeddings waiting to be sent together in the next batch
+        self._pending_query_embeddings: Dict[str, asyncio.Future] = {}
+        # Queries whose batch has been sent but not answered yet
+        self._inflight_query_embeddings: Dict[str, asyncio.Future] = {}
+        self._embedding_flush_handle: Optional[asyncio.TimerHandle] = None
+        self._embedding_batch_tasks: set = set()
     
     async def _get_db_connection(self) -> asyncpg.Connection:
         """Get database connection from pool"""
         if not self._db_pool:
-            # Parse DATABASE_URL to get connection parameters
-            db_url = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
-            self._db_pool = await asyncpg.create_pool(
-                db_url,
-                min_size=1,
-                max_size=10,
-                command_timeout=60
-            )
+            # Concurrent first requests would otherwise each create a pool
+            async with self._db_pool_lock:
+                if not self._db_pool:
+                    # Parse DATABASE_URL to get connection parameters
+                    db_url = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+                    self._db_pool = await asyncpg.create_pool(
+                        db_url,
+                        min_size=settings.DB_POOL_MIN_SIZE,
+                        max_size=settings.DB_POOL_MAX_SIZE,
+                        max_inactive_connection_lifetime=settings.DB_POOL_MAX_IDLE_TIME,
+                        command_timeout=60,
+                        # Short OLTP queries; JIT compilation only adds planning latency
+                        server_settings={"jit": "off"}
+                    )
         
-        return await self._db_pool.acquire()
+        return await self._db_pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
     
     async def _release_db_connection(self, conn: asyncpg.Connection):
         """Release database connection back to pool"""
@@ -145,6 +172,113 @@ class RAGService:
             logger.error(f"Error creating embedding: {str(e)}")
             raise
     
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        Create embedding for a search query, reusing recent results
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            Embedding vector
+            
+        Raises:
+            ValueError: If the query is empty or too long to embed (checked before
+                batching, so it cannot fail the other queries in its batch)
+        """
+        if not query.strip():
+            raise ValueError("Cannot embed an empty query")
+        if len(query) > settings.EMBEDDING_MAX_QUERY_CHARS:
+            raise ValueError(f"Query too long to embed ({len(query)} characters)")
+        
+        embedding = self._query_embedding_cache.get(query)
+        if embedding is not None:
+            self._query_embedding_cache.move_to_end(query)
+            return embedding
+        
+        # Join a pending batch, or the batch already sent for the same query
+        future = self._pending_query_embeddings.get(query) or self._inflight_query_embeddings.get(query)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending_query_embeddings[query] = future
+            
+            if len(self._pending_query_embeddings) >= settings.EMBEDDING_BATCH_SIZE:
+                self._flush_query_embeddings()
+            elif self._embedding_flush_handle is None:
+                self._embedding_flush_handle = loop.call_later(
+                    settings.EMBEDDING_BATCH_WAIT, self._flush_query_embeddings
+                )
+        
+        # Shielded so one cancelled caller doesn't cancel the result for the others
+        return await asyncio.shield(future)
+    
+    def _flush_query_embeddings(self):
+        """Send all pending query embeddings as one batched API call"""
+        if self._embedding_flush_handle is not None:
+            self._embedding_flush_handle.cancel()
+            self._embedding_flush_handle = None
+        
+        batch, self._pending_query_embeddings = self._pending_query_embeddings, {}
+        self._inflight_query_embeddings.update(batch)
+        task = asyncio.create_task(self._embed_query_batch(batch))
+        self._embedding_batch_tasks.add(task)
+        task.add_done_callback(self._embedding_batch_tasks.discard)
+    
+    async def _embed_query_batch(self, batch: Dict[str, asyncio.Future]):
+        """Embed a batch of queries, caching and delivering each result to its waiters"""
+        try:
+            embeddings = await self.create_embeddings(list(batch))
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Error creating query embedding: {str(e)}")
+                embeddings = [e]
+            else:
+                # Retry each query on its own, so only the one that caused the failure errors
+                logger.warning(f"Error creating embeddings for {len(batch)} queries, retrying one by one: {str(e)}")
+                embeddings = await asyncio.gather(
+                    *(self._create_embedding(query) for query in batch),
+                    return_exceptions=True
+                )
+        finally:
+            for query, future in batch.items():
+                if self._inflight_query_embeddings.get(query) is future:
+                    del self._inflight_query_embeddings[query]
+        
+        for (query, future), embedding in zip(batch.items(), embeddings):
+            if isinstance(embedding, BaseException):
+                if not future.done():
+                    future.set_exception(embedding)
+                    # Waiters still get the error; this keeps asyncio from logging
+                    # it as never retrieved when every waiter has been cancelled
+                    future.exception()
+                continue
+            
+            self._query_embedding_cache[query] = embedding
+            if not future.done():
+                future.set_result(embedding)
+        
+        while len(self._query_embedding_cache) > self._query_embedding_cache_size:
+            self._query_embedding_cache.popitem(last=False)
+    
+    async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Create embeddings for several texts in a single API call
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Embedding vectors in input order
+        """
+        response = await self.openai_client.embeddings.create(
+            model=self.embedding_model,
+            input=texts,
+            encoding_format="float"
+        )
+        
+        return [item.embedding for item in response.data]
+    
     async def search_documents(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Search documents using vector similarity
@@ -158,7 +292,7 @@ class RAGService:
         """
         try:
             # Create embedding for query
-            query_embedding = await self._create_embedding(query)
+            query_embedding = await self.embed_query(query)
             
             # Get database connection
             conn = await self._get_db_connection()
@@ -184,48 +318,83 @@ class RAGService:
                 
                 rows = await conn.fetch(search_query, min(1000, top_k * 50))  # Get enough chunks to find good matches
                 
-                results = []
-                
-                # For each row, calculate similarity manually since embeddings are stored as JSONB
-                for row in rows:
-                    try:
-                        # Parse the stored embedding from JSONB
-                        stored_embedding = json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
-                        
-                        # Calculate cosine similarity manually
-                        similarity = self._calculate_cosine_similarity(query_embedding, stored_embedding)
-                        
-                        # Only include results above similarity threshold
-                        if similarity > 0.3:
-                            results.append({
-                                "id": str(row["id"]),
-                                "title": row["original_filename"] or row["filename"],
-                                "content": row["content"],
-                                "filename": row["filename"],
-                                "similarity": float(similarity),
-                                "metadata": row["chunk_metadata"] or {},
-                                "chunk_id": str(row["id"]),
-                                "document_id": str(row["document_id"]),
-                                "embedding_model": row["embedding_model"]
-                            })
-                    except Exception as e:
-                        logger.warning(f"Error processing chunk {row['id']}: {e}")
-                        continue
-                
-                # Sort by similarity and return top_k
-                results.sort(key=lambda x: x["similarity"], reverse=True)
-                results = results[:top_k]
-                
-                logger.info(f"Found {len(results)} relevant documents for query: {query[:50]}...")
-                return results
-                
             finally:
                 await self._release_db_connection(conn)
+            
+            # Scoring is CPU-bound (one 3072-dim dot product per row), so keep it off the event loop
+            results = await asyncio.to_thread(self._score_chunks, query_embedding, rows, top_k)
+            
+            logger.info(f"Found {len(results)} relevant documents for query: {query[:50]}...")
+            return results
                 
         except Exception as e:
             logger.error(f"Error searching documents: {str(e)}")
             return []
     
+    def _score_chunks(self, query_embedding: List[float], rows: List[asyncpg.Record], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Rank fetched chunks by cosine similarity to the query embedding
+        
+        Args:
+            query_embedding: Embedding of the search query
+            rows: Chunk rows including their stored embeddings
+            top_k: Number of top results to return
+            
+        Returns:
+            Top chunks above the similarity threshold, most similar first
+        """
+        query_magnitude = math.hypot(*query_embedding)
+        if query_magnitude == 0:
+            return []
+        
+        results = []
+        
+        # For each row, calculate similarity manually since embeddings are stored as JSONB
+        for row in rows:
+            try:
+                # Parse the stored embedding from JSONB
+                stored_embedding = json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
+                
+                similarity = self._cosine_similarity_with_magnitude(query_embedding, query_magnitude, stored_embedding)
+                
+                # Only include results above similarity threshold
+                if similarity > 0.3:
+                    results.append({
+                        "id": str(row["id"]),
+                        "title": row["original_filename"] or row["filename"],
+                        "content": row["content"],
+                        "filename": row["filename"],
+                        "similarity": float(similarity),
+                        "metadata": row["chunk_metadata"] or {},
+                        "chunk_id": str(row["id"]),
+                        "document_id": str(row["document_id"]),
+                        "embedding_model": row["embedding_model"]
+                    })
+            except Exception as e:
+                logger.warning(f"Error processing chunk {row['id']}: {e}")
+                continue
+        
+        # Sort by similarity and return top_k
+        results.sort(key=lambda x: x["similarity"], reverse=True)
+        return results[:top_k]
+    
+    @staticmethod
+    def _cosine_similarity_with_magnitude(query: List[float], query_magnitude: float, vec: List[float]) -> float:
+        """Cosine similarity (clamped to 0-1) against a query whose magnitude is precomputed"""
+        if len(query) != len(vec):
+            # Handle different lengths (shouldn't happen but be safe)
+            min_len = min(len(query), len(vec))
+            query = query[:min_len]
+            vec = vec[:min_len]
+            query_magnitude = math.hypot(*query)
+        
+        magnitude = math.hypot(*vec)
+        if query_magnitude == 0 or magnitude == 0:
+            return 0.0
+        
+        similarity = sum(map(operator.mul, query, vec)) / (query_magnitude * magnitude)
+        return max(0.0, min(1.0, similarity))
+    
     def _calculate_cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """
         Calculate cosine similarity between two vectors
@@ -238,30 +407,7 @@ class RAGService:
             Cosine similarity score (0-1)
         """
         try:
-            import math
-            
-            # Handle different lengths (shouldn't happen but be safe)
-            if len(vec1) != len(vec2):
-                min_len = min(len(vec1), len(vec2))
-                vec1 = vec1[:min_len]
-                vec2 = vec2[:min_len]
-            
-            # Calculate dot product
-            dot_product = sum(a * b for a, b in zip(vec1, vec2))
-            
-            # Calculate magnitudes
-            magnitude1 = math.sqrt(sum(a * a for a in vec1))
-            magnitude2 = math.sqrt(sum(a * a for a in vec2))
-            
-            # Avoid division by zero
-            if magnitude1 == 0 or magnitude2 == 0:
-                return 0.0
-            
-            # Calculate cosine similarity
-            similarity = dot_product / (magnitude1 * magnitude2)
-            
-            # Ensure result is between 0 and 1
-            return max(0.0, min(1.0, similarity))
+            return self._cosine_similarity_with_magnitude(vec1, math.hypot(*vec1), vec2)
             
         except Exception as e:
             logger.error(f"Error calculating cosine similarity: {e}")
@@ -336,32 +482,30 @@ class RAGService:
                 
                 logger.info(f"Created {len(chunks)} chunks for document {doc_name}")
                 
-                # Process chunks in batches to avoid memory issues
+                # Embed chunks in batches (one API call each), several batches at a time
                 batch_size = 10
-                for i in range(0, len(chunks), batch_size):
-                    batch = chunks[i:i + batch_size]
-                    
-                    # Create embeddings for batch
-                    embeddings = []
-                    for chunk in batch:
-                        embedding = await self._create_embedding(chunk["text"])
-                        embeddings.append(embedding)
-                    
-                    # Insert chunk records
-                    for chunk, embedding in zip(batch, embeddings):
-                        await conn.execute(
-                            """
-                            INSERT INTO document_chunks 
-                            (document_id, content, embedding, metadata, filename, title)
-                            VALUES ($1, $2, $3, $4, $5, $6)
-                            """,
-                            doc_id,
-                            chunk["text"],
-                            embedding,
-                            chunk["metadata"],
-                            doc_name,
-                            doc_name
-                        )
+                batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+                embedding_semaphore = asyncio.Semaphore(settings.EMBEDDING_UPLOAD_CONCURRENCY)
+                
+                async def embed_batch(batch: List[Dict[str, Any]]) -> List[List[float]]:
+                    async with embedding_semaphore:
+                        return await self.create_embeddings([chunk["text"] for chunk in batch])
+                
+                batch_embeddings = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+                
+                # Insert chunk records
+                await conn.executemany(
+                    """
+                    INSERT INTO document_chunks 
+                    (document_id, content, embedding, metadata, filename, title)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    """,
+                    [
+                        (doc_id, chunk["text"], embedding, chunk["metadata"], doc_name, doc_name)
+                        for batch, embeddings in zip(batches, batch_embeddings)
+                        for chunk, embedding in zip(batch, embeddings)
+                    ]
+                )
                 
                 logger.info(f"Successfully uploaded and processed document: {doc_name}")
                 return True
@@ -377,12 +521,19 @@ class RAGService:
         """
         Extract text content from various file types
         
+        Parsing reads the file from disk page by page, so it runs in a worker
+        thread to keep the event loop serving chat requests meanwhile.
+        
         Args:
             file_path: Path to file
             
         Returns:
             Extracted text content
         """
+        return await asyncio.to_thread(self._extract_text_sync, file_path)
+    
+    def _extract_text_sync(self, file_path: Path) -> str:
+        """Blocking text extraction behind _extract_text_from_file"""
         try:
             suffix = file_path.suffix.lower()
             
@@ -396,10 +547,7 @@ class RAGService:
                     import PyPDF2
                     with open(file_path, 'rb') as file:
                         reader = PyPDF2.PdfReader(file)
-                        text = ""
-                        for page in reader.pages:
-                            text += page.extract_text() + "\n"
-                        return text
+                        return "".join(page.extract_text() + "\n" for page in reader.pages)
                 except ImportError:
                     logger.error("PyPDF2 not installed. Cannot process PDF files.")
                     return ""
@@ -409,10 +557,7 @@ class RAGService:
                 try:
                     from docx import Document
                     doc = Document(file_path)
-                    text = ""
-                    for paragraph in doc.paragraphs:
-                        text += paragraph.text + "\n"
-                    return text
+                    return "".join(paragraph.text + "\n" for paragraph in doc.paragraphs)
                 except ImportError:
                     logger.error("python-docx not installed. Cannot process DOCX files.")
                     return ""
@@ -494,21 +639,25 @@ class RAGService:
             Health status
         """
         try:
-            # Test OpenAI API
-            await self._create_embedding("test")
-            
-            # Test database connection
-            conn = await self._get_db_connection()
-            try:
-                await conn.fetchval("SELECT 1")
-                return True
-            finally:
-                await self._release_db_connection(conn)
+            # Test OpenAI API and database connection concurrently
+            await asyncio.gather(
+                self._create_embedding("test"),
+                self._check_database()
+            )
+            return True
                 
         except Exception as e:
             logger.error(f"Health check failed: {str(e)}")
             return False
     
+    async def _check_database(self):
+        """Run a trivial query to confirm the database is reachable"""
+        conn = await self._get_db_connection()
+        try:
+            await conn.fetchval("SELECT 1")
+        finally:
+            await self._release_db_connection(conn)
+    
     async def delete_document(self, document_id: int) -> bool:
         """
         Delete document and its chunks
@@ -560,15 +709,23 @@ class RAGService:
             conn = await self._get_db_connection()
             
             try:
+                # Aggregate each table on its own; joining them first would pair every
+                # document row with each of its chunks and need a DISTINCT over the result
                 stats = await conn.fetchrow(
                     """
                     SELECT 
-                        COUNT(DISTINCT d.id) as total_documents,
-                        COUNT(c.id) as total_chunks,
-                        AVG(LENGTH(c.content)) as avg_chunk_length,
-                        MAX(d.created_at) as latest_upload
-                    FROM documents d
-                    LEFT JOIN document_chunks c ON d.id = c.document_id
+                        d.total_documents,
+                        d.latest_upload,
+                        c.total_chunks,
+                        c.avg_chunk_length
+                    FROM (
+                        SELECT COUNT(*) as total_documents, MAX(created_at) as latest_upload
+                        FROM documents
+                    ) d
+                    CROSS JOIN (
+                        SELECT COUNT(*) as total_chunks, AVG(LENGTH(content)) as avg_chunk_length
+                        FROM document_chunks
+                    ) c
                     """
                 )
                 
@@ -590,9 +747,14 @@ class RAGService:
             logger.error(f"Error getting stats: {str(e)}")
             return {}
     
+    async def aclose(self):
+        """Close the database connection pool"""
+        if self._db_pool:
+            await self._db_pool.close()
+            self._db_pool = None
+    
     async def __aenter__(self):
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self._db_pool:
-            await self._db_pool.close()
\ No newline at end of file
+        await self.aclose()
\ No newline at end of file
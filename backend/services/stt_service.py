@@ -1,21 +1,58 @@
 import asyncio
+import hashlib
 import logging
-from typing import Optional
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Optional, Tuple
 import io
+import httpx
 import openai
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# File extensions accepted by the Whisper API
+SUPPORTED_FORMATS = frozenset({
+    "flac", "m4a", "mp3", "mp4", "mpeg", "mpga", 
+    "oga", "ogg", "wav", "webm"
+})
+
+# Redis key prefix for cached transcriptions, followed by the audio digest and language
+STT_CACHE_KEY_PREFIX = "stt:"
+
+# Audio is downsampled before upload when ffmpeg is installed
+FFMPEG_PATH = shutil.which("ffmpeg")
+TRANSCODE_TIMEOUT = 60.0  # seconds
+
+# Whisper resamples to 16 kHz mono itself, so low-bitrate Opus loses no accuracy
+TRANSCODE_ARGS = (
+    "-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "16k", "-f", "ogg", "pipe:1"
+)
+
 
 class STTService:
     """
     Speech-to-Text service using OpenAI Whisper API
     """
     
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None, redis_client: Any = None):
+        # Async client so uploads don't block the event loop; reuses the caller's
+        # connection pool when given one (e.g. the agent's HTTP/2 client)
+        self.client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=http_client,
+            max_retries=settings.OPENAI_MAX_RETRIES
+        )
         self.model = settings.WHISPER_MODEL
+        self.timeout = settings.WHISPER_TIMEOUT
+        
+        # Optional Redis client caching transcriptions by audio content
+        self._redis = redis_client
+        
+        # Caps in-flight Whisper requests so bursts stay within the OpenAI rate limit;
+        # the client retries 429s with exponential backoff and jitter
+        self._whisper_semaphore = asyncio.Semaphore(settings.WHISPER_MAX_CONCURRENT_REQUESTS)
     
     async def transcribe_audio(
         self, 
@@ -29,6 +66,27 @@ class STTService:
             audio_data: Audio file bytes
             language: Language code (optional, auto-detect if not provided)
             
+        Returns:
+            Transcribed text
+        """
+        return await self.transcribe_stream(io.BytesIO(audio_data), language)
+    
+    async def transcribe_stream(
+        self, 
+        audio_file: BinaryIO, 
+        language: Optional[str] = None
+    ) -> str:
+        """
+        Transcribe audio read from a file object using OpenAI Whisper API
+        
+        The file is streamed into the upload request, so large recordings
+        are never held in memory as a whole. Identical audio is answered from
+        the Redis cache when one is configured.
+        
+        Args:
+            audio_file: Binary file object positioned at the start of the audio
+            language: Language code (optional, auto-detect if not provided)
+            
         Returns:
             Transcribed text
         """
@@ -37,30 +95,112 @@ class STTService:
                 logger.error("OpenAI API key not configured")
                 raise ValueError("OpenAI API key not configured")
             
-            # Create a file-like object from bytes
-            audio_file = io.BytesIO(audio_data)
-            audio_file.name = "audio.wav"  # Required for API
+            cache_key = None
+            if self._redis is not None:
+                digest = await asyncio.to_thread(self._hash_audio, audio_file)
+                cache_key = f"{STT_CACHE_KEY_PREFIX}{digest}:{language or 'auto'}"
+                cached_text = await self._get_cached_transcription(cache_key)
+                if cached_text is not None:
+                    logger.info("Serving cached transcription")
+                    return cached_text
             
-            logger.info(f"Transcribing audio ({len(audio_data)} bytes)...")
+            logger.info("Transcribing audio...")
             
-            # Call OpenAI Whisper API
-            transcript = self.client.audio.transcriptions.create(
-                model=self.model,
-                file=audio_file,
-                language=language,
-                response_format="text"
-            )
+            upload = await self._prepare_upload(audio_file)
+            
+            # Call OpenAI Whisper API (the file name is required by the API)
+            async with self._whisper_semaphore:
+                transcript = await self.client.audio.transcriptions.create(
+                    model=self.model,
+                    file=upload,
+                    language=language,
+                    response_format="text",
+                    timeout=self.timeout
+                )
             
             # The response is directly the text
             transcribed_text = transcript.strip()
             
             logger.info(f"Transcription completed: {transcribed_text[:100]}...")
+            if cache_key is not None:
+                await self._cache_transcription(cache_key, transcribed_text)
             return transcribed_text
             
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}")
             raise ValueError(f"Transcription failed: {str(e)}")
     
+    @staticmethod
+    def _hash_audio(audio_file: BinaryIO) -> str:
+        """Digest of the whole audio file, read in chunks (rewinds the file afterwards)"""
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in iter(lambda: audio_file.read(1 << 20), b""):
+            digest.update(chunk)
+        audio_file.seek(0)
+        return digest.hexdigest()
+    
+    async def _get_cached_transcription(self, cache_key: str) -> Optional[str]:
+        """Return a cached transcription, treating Redis errors as a miss"""
+        try:
+            cached_text = await self._redis.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Could not read transcription cache: {e}")
+            return None
+        return cached_text.decode() if cached_text is not None else None
+    
+    async def _cache_transcription(self, cache_key: str, text: str):
+        """Store a transcription in Redis for STT_CACHE_TTL seconds"""
+        try:
+            await self._redis.set(cache_key, text, ex=settings.STT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not save transcription to cache: {e}")
+    
+    async def _prepare_upload(self, audio_file: BinaryIO) -> Tuple[str, Any]:
+        """
+        Downsample larger recordings to 16 kHz mono Opus before upload
+        
+        Args:
+            audio_file: Binary file object positioned at the start of the audio
+            
+        Returns:
+            File name and content for the Whisper request; the original file
+            when ffmpeg is unavailable, the file is small or transcoding fails
+        """
+        original = ("audio.wav", audio_file)
+        if FFMPEG_PATH is None:
+            return original
+        
+        size = audio_file.seek(0, os.SEEK_END)
+        audio_file.seek(0)
+        if size < settings.WHISPER_TRANSCODE_MIN_BYTES:
+            return original
+        
+        # ffmpeg needs a seekable input for containers like mp4/m4a, so copy to a named file
+        with tempfile.NamedTemporaryFile(suffix=".audio") as source:
+            await asyncio.to_thread(shutil.copyfileobj, audio_file, source)
+            await asyncio.to_thread(source.flush)
+            audio_file.seek(0)
+            
+            process = await asyncio.create_subprocess_exec(
+                FFMPEG_PATH, "-nostdin", "-loglevel", "error", "-i", source.name, *TRANSCODE_ARGS,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                transcoded, stderr = await asyncio.wait_for(process.communicate(), TRANSCODE_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.warning("Audio transcoding timed out, uploading original")
+                return original
+        
+        if process.returncode != 0 or not transcoded:
+            logger.warning(f"Audio transcoding failed, uploading original: {stderr.decode(errors='replace')[:200]}")
+            return original
+        
+        logger.info(f"Transcoded audio from {size} to {len(transcoded)} bytes")
+        return ("audio.ogg", transcoded)
+    
     async def transcribe_file(
         self, 
         file_path: str, 
@@ -85,12 +225,14 @@ class STTService:
             
             # Open audio file
             with open(file_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model=self.model,
-                    file=audio_file,
-                    language=language,
-                    response_format="text"
-                )
+                async with self._whisper_semaphore:
+                    transcript = await self.client.audio.transcriptions.create(
+                        model=self.model,
+                        file=audio_file,
+                        language=language,
+                        response_format="text",
+                        timeout=self.timeout
+                    )
             
             transcribed_text = transcript.strip()
             
@@ -128,11 +270,13 @@ class STTService:
             logger.info(f"Translating audio ({len(audio_data)} bytes) to {target_language}...")
             
             # Call OpenAI Whisper translation API
-            translation = self.client.audio.translations.create(
-                model=self.model,
-                file=audio_file,
-                response_format="text"
-            )
+            async with self._whisper_semaphore:
+                translation = await self.client.audio.translations.create(
+                    model=self.model,
+                    file=audio_file,
+                    response_format="text",
+                    timeout=self.timeout
+                )
             
             translated_text = translation.strip()
             
@@ -169,10 +313,7 @@ class STTService:
         Returns:
             List of supported file extensions
         """
-        return [
-            "flac", "m4a", "mp3", "mp4", "mpeg", "mpga", 
-            "oga", "ogg", "wav", "webm"
-        ]
+        return sorted(SUPPORTED_FORMATS)
     
     def get_max_file_size(self) -> int:
         """
@@ -1,24 +1,139 @@
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import List, Dict, Any, Optional, Tuple
 import httpx
+import orjson
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Official EU sites searched for verification and policy updates
+EU_OFFICIAL_DOMAINS = [
+    "europa.eu",
+    "ec.europa.eu",
+    "consilium.europa.eu", 
+    "europarl.europa.eu",
+    "eur-lex.europa.eu"  # Add EU law database
+]
+EU_POLICY_UPDATE_DOMAINS = EU_OFFICIAL_DOMAINS[:3]
+
 
 class WebService:
     """
     Web search service using Tavily for real-time information verification
     """
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.api_key = settings.TAVILY_API_KEY
         self.base_url = "https://api.tavily.com/search"
         self.max_results = settings.TAVILY_MAX_RESULTS
         self.timeout = 15.0  # 15 second timeout for web searches
         
-        # HTTP client settings - we create fresh clients per request to avoid reuse issues
+        # Shared connection pool from the caller; without one, keep our own for the
+        # service's lifetime so repeated searches reuse the TLS connection
+        self._owns_http_client = http_client is None
+        self._http_client = http_client or httpx.AsyncClient(
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+        
+        # LRU/TTL cache of Tavily responses, keyed by the exact search parameters
+        self._search_cache: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Searches currently in flight, so concurrent identical searches share one request
+        self._inflight_searches: Dict[bytes, asyncio.Task] = {}
+        
+        # Caps concurrent Tavily requests, keeping bursts under the API rate limit
+        self._request_semaphore = asyncio.Semaphore(settings.TAVILY_MAX_CONCURRENT_REQUESTS)
+    
+    async def __aenter__(self) -> "WebService":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def aclose(self) -> None:
+        """Close the HTTP client if this service created it"""
+        if self._owns_http_client:
+            await self._http_client.aclose()
+    
+    async def _post(self, payload: Dict[str, Any]) -> httpx.Response:
+        """Send a Tavily search request"""
+        async with self._request_semaphore:
+            return await self._http_client.post(self.base_url, json=payload, timeout=self.timeout)
+    
+    async def _tavily_search(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a Tavily search, reusing an identical recent or in-flight search
+        
+        Args:
+            payload: Tavily search parameters
+            
+        Returns:
+            Parsed Tavily response
+        """
+        cache_key = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        entry = self._search_cache.get(cache_key)
+        if entry is not None and time.monotonic() - entry[0] <= settings.TAVILY_CACHE_TTL:
+            self._search_cache.move_to_end(cache_key)
+            logger.debug("Serving cached Tavily response")
+            return entry[1]
+        
+        search = self._inflight_searches.get(cache_key)
+        if search is None:
+            search = asyncio.create_task(self._fetch_search(cache_key, payload))
+            self._inflight_searches[cache_key] = search
+            search.add_done_callback(lambda task: self._forget_search(cache_key, task))
+        
+        # Shielded so one cancelled caller doesn't cancel the search for the others
+        return await asyncio.shield(search)
+    
+    def _forget_search(self, cache_key: bytes, search: asyncio.Task):
+        """Drop a finished search from the in-flight map"""
+        self._inflight_searches.pop(cache_key, None)
+        # Every caller may have been cancelled (e.g. the agent served a cached answer);
+        # retrieve the error so asyncio doesn't log it as never retrieved
+        if not search.cancelled():
+            search.exception()
+    
+    async def _fetch_search(self, cache_key: bytes, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a Tavily search and cache its parsed response"""
+        response = await self._post(payload)
+        response.raise_for_status()
+        data = response.json()
+        
+        self._search_cache[cache_key] = (time.monotonic(), data)
+        self._search_cache.move_to_end(cache_key)
+        while len(self._search_cache) > settings.TAVILY_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        return data
+    
+    @staticmethod
+    def _parse_results(data: Dict[str, Any], source: str) -> List[Dict[str, Any]]:
+        """
+        Convert Tavily results to the result dicts used by the agent
+        
+        Args:
+            data: Parsed Tavily response
+            source: Source label for the results
+            
+        Returns:
+            List of search results
+        """
+        return [
+            {
+                "title": result.get("title", ""),
+                "url": result.get("url", ""),
+                "content": result.get("content", ""),
+                "score": result.get("score", 0.0),
+                "published_date": result.get("published_date", ""),
+                "source": source
+            }
+            for result in data.get("results", [])
+        ]
     
     async def search_for_verification(self, query: str) -> List[Dict[str, Any]]:
         """
@@ -42,52 +157,32 @@ class WebService:
                 "api_key": self.api_key,
                 "query": enhanced_query,
                 "search_depth": "basic",
-                "include_answer": True,
+                "include_answer": False,  # Tavily's generated answer is not used
                 "include_raw_content": False,
                 "max_results": self.max_results,
-                "include_domains": [
-                    "europa.eu",
-                    "ec.europa.eu",
-                    "consilium.europa.eu", 
-                    "europarl.europa.eu",
-                    "eur-lex.europa.eu"  # Add EU law database
-                ]
+                "include_domains": EU_OFFICIAL_DOMAINS
             }
             
             logger.info(f"Searching web for verification: {enhanced_query[:100]}...")
             
-            # Use a fresh client for each request to avoid "client closed" errors
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(self.base_url, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
+            if settings.TAVILY_SEARCH_PER_DOMAIN:
+                # europa.eu stays in for its other sites (commission., eea., ...); results it
+                # shares with the listed subdomains are merged by URL
+                results = await self._search_each_domain(payload, EU_OFFICIAL_DOMAINS)
+            else:
+                data = await self._tavily_search(payload)
                 
                 # Parse Tavily response
-                results = []
-                tavily_results = data.get("results", [])
-                logger.info(f"Tavily verification search returned {len(tavily_results)} results")
-                
-                for i, result in enumerate(tavily_results):
-                    title = result.get("title", "")
-                    url = result.get("url", "")
-                    logger.info(f"Verification result {i}: {title[:50]}... - URL present: {bool(url)}")
-                    
-                    results.append({
-                        "title": title,
-                        "url": url,
-                        "content": result.get("content", ""),
-                        "score": result.get("score", 0.0),
-                        "published_date": result.get("published_date", ""),
-                        "source": "web_search"
-                    })
-                
-                # Store overall answer separately (don't treat as a source)
-                # The overall answer will be used by the agent for context but not as a source
-                
-                logger.info(f"Processed {len(results)} web verification results")
-                return results
-                
+                results = self._parse_results(data, "web_search")
+            logger.debug(f"Tavily verification search returned {len(results)} results")
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, result in enumerate(results):
+                    logger.debug(f"Verification result {i}: {result['title'][:50]}... - URL present: {bool(result['url'])}")
+            
+            logger.info(f"Processed {len(results)} web verification results")
+            return results
+            
         except httpx.HTTPError as e:
             logger.error(f"Tavily API error: {str(e)}")
             return []
@@ -95,6 +190,36 @@ class WebService:
             logger.error(f"Error in web search: {str(e)}")
             return []
     
+    async def _search_each_domain(self, payload: Dict[str, Any], domains: List[str]) -> List[Dict[str, Any]]:
+        """
+        Run one search per domain concurrently and merge the best results
+        
+        Tavily ranks each domain separately, so smaller sites are not crowded
+        out by larger ones as they can be in a single multi-domain search.
+        
+        Args:
+            payload: Tavily search parameters
+            domains: Domains to search one at a time
+            
+        Returns:
+            Results deduplicated by URL, highest score first
+        """
+        responses = await asyncio.gather(
+            *(self._tavily_search({**payload, "include_domains": [domain]}) for domain in domains),
+            return_exceptions=True
+        )
+        
+        merged: Dict[str, Dict[str, Any]] = {}
+        for domain, response in zip(domains, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"Verification search on {domain} failed: {response}")
+                continue
+            for result in self._parse_results(response, "web_search"):
+                merged.setdefault(result["url"], result)
+        
+        results = sorted(merged.values(), key=lambda result: result["score"] or 0.0, reverse=True)
+        return results[:payload["max_results"]]
+    
     async def search_current_news(self, query: str) -> List[Dict[str, Any]]:
         """
         Search for broader EU policy information and recent updates
@@ -117,7 +242,7 @@ class WebService:
                 "api_key": self.api_key,
                 "query": broad_query,
                 "search_depth": "basic",
-                "include_answer": True,
+                "include_answer": False,  # Tavily's generated answer is not used
                 "include_raw_content": False,
                 "max_results": 5,
                 # No domain restrictions for broader coverage - this allows all sources
@@ -125,35 +250,19 @@ class WebService:
             
             logger.info(f"Searching for broader EU policy info: {broad_query[:100]}...")
             
-            # Use a fresh client for each request to avoid "client closed" errors  
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(self.base_url, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                # Parse broader search results
-                results = []
-                tavily_results = data.get("results", [])
-                logger.info(f"Tavily broader search returned {len(tavily_results)} results")
-                
-                for i, result in enumerate(tavily_results):
-                    title = result.get("title", "")
-                    url = result.get("url", "")
-                    logger.info(f"Broader result {i}: {title[:50]}... - URL present: {bool(url)}")
-                    
-                    results.append({
-                        "title": title,
-                        "url": url,
-                        "content": result.get("content", ""),
-                        "score": result.get("score", 0.0),
-                        "published_date": result.get("published_date", ""),
-                        "source": "broad_search"
-                    })
-                
-                logger.info(f"Processed {len(results)} broader EU policy results")
-                return results
-                
+            data = await self._tavily_search(payload)
+            
+            # Parse broader search results
+            results = self._parse_results(data, "broad_search")
+            logger.debug(f"Tavily broader search returned {len(results)} results")
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, result in enumerate(results):
+                    logger.debug(f"Broader result {i}: {result['title'][:50]}... - URL present: {bool(result['url'])}")
+            
+            logger.info(f"Processed {len(results)} broader EU policy results")
+            return results
+            
         except Exception as e:
             logger.error(f"Error in news search: {str(e)}")
             return []
@@ -172,44 +281,26 @@ class WebService:
             if not self.api_key:
                 return []
             
-            update_query = f"{policy_name} EU policy updates changes 2024 2025"
+            # Last year and this year, so the search keeps up with the calendar
+            current_year = date.today().year
+            update_query = f"{policy_name} EU policy updates changes {current_year - 1} {current_year}"
             
             payload = {
                 "api_key": self.api_key,
                 "query": update_query,
                 "search_depth": "advanced",
-                "include_answer": True,
+                "include_answer": False,  # Tavily's generated answer is not used
                 "include_raw_content": False,
                 "max_results": 3,
-                "include_domains": [
-                    "europa.eu",
-                    "ec.europa.eu",
-                    "consilium.europa.eu"
-                ]
+                "include_domains": EU_POLICY_UPDATE_DOMAINS
             }
             
             logger.info(f"Checking policy updates for: {policy_name}")
             
-            # Use a fresh client for each request to avoid "client closed" errors
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(self.base_url, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                results = []
-                for result in data.get("results", []):
-                    results.append({
-                        "title": result.get("title", ""),
-                        "url": result.get("url", ""),
-                        "content": result.get("content", ""),
-                        "score": result.get("score", 0.0),
-                        "published_date": result.get("published_date", ""),
-                        "source": "policy_update"
-                    })
-                
-                return results
-                
+            data = await self._tavily_search(payload)
+            
+            return self._parse_results(data, "policy_update")
+            
         except Exception as e:
             logger.error(f"Error checking policy updates: {str(e)}")
             return []
@@ -232,12 +323,33 @@ class WebService:
                 "max_results": 1
             }
             
-            # Use a fresh client for each request to avoid "client closed" errors
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(self.base_url, json=test_payload)
-                return response.status_code == 200
-                
+            response = await self._post(test_payload)
+            return response.status_code == 200
+            
         except Exception as e:
             logger.error(f"Tavily health check failed: {str(e)}")
             return False
     
+
+
+class NullWebService:
+    """
+    Drop-in for WebService when web research is disabled or not configured
+    
+    Returns empty results without network calls, so callers need no None checks.
+    """
+    
+    async def search_for_verification(self, query: str) -> List[Dict[str, Any]]:
+        return []
+    
+    async def search_current_news(self, query: str) -> List[Dict[str, Any]]:
+        return []
+    
+    async def check_policy_updates(self, policy_name: str) -> List[Dict[str, Any]]:
+        return []
+    
+    async def health_check(self) -> bool:
+        return False
+    
+    async def aclose(self) -> None:
+        pass